@@ -0,0 +1,224 @@
+import hashlib
+import json
+from collections import OrderedDict, namedtuple
+
+import fitz
+
+from flagging import Flag
+from inference_service import InferenceClient
+from instrumentation import span
+from nlp_pipeline import parse_contract
+from predict import ModelHandle, load_model, model_version, recorded_screen_margin, run_prediction
+from result_cache import cache_key
+
+QUESTIONS_PATH = "cuad-training/cuad-data/test.json"
+# the CUAD categories reviewed for ASC 606 by default
+ACCOUNTING_QUESTIONS = [2, 3, 5, 15]
+
+# longest unfinished sentence carried over to the next page before it is flagged as is
+MAX_CARRY = 20000
+
+# flags found on one PDF page; Flag offsets index into the whole contract text
+PageFlags = namedtuple("PageFlags", ["page_number", "page_count", "text", "flags"])
+
+
+def load_questions(path=QUESTIONS_PATH, indices=ACCOUNTING_QUESTIONS):
+    with open(path) as json_file:
+        data = json.load(json_file)
+
+    questions = [qa['question'] for qa in data['data'][0]['paragraphs'][0]['qas']]
+    if indices is None:
+        return questions
+    return [questions[index] for index in indices]
+
+
+def pdf_digest(pdf_bytes):
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+def extract_text(pdf_bytes):
+    with span("extract") as counts, fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        text = "".join(page.getText() for page in doc)
+        counts["pages"] = doc.pageCount
+        counts["characters"] = len(text)
+        return text
+
+
+def _text_key(digest):
+    return cache_key("text", digest, fitz.VersionBind)
+
+
+def _text_digest(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _flags_key(digest, text, flagger):
+    # flag offsets index into one extraction of the PDF, so a re-extracted text never reuses them
+    return cache_key("flags", digest, _text_digest(text), flagger.version)
+
+
+def _encode_flags(flags):
+    return OrderedDict((category, [list(flag) for flag in category_flags]) for category, category_flags in flags.items())
+
+
+def _decode_flags(flags):
+    return OrderedDict((category, [Flag(*flag) for flag in category_flags]) for category, category_flags in flags.items())
+
+
+def contract_text(pdf_bytes, digest, cache=None):
+    if cache is None:
+        return extract_text(pdf_bytes)
+    return cache.get_or_compute(_text_key(digest), lambda: extract_text(pdf_bytes))
+
+
+def contract_flags(text, digest, nlp, flagger, cache=None, n_process=1, store=None):
+    """{category: [Flag, ...]} for the contract, parsing it only on a cache miss.
+
+    With a DocStore, a contract parsed before is only matched again, e.g. after a lexicon change.
+    """
+    def compute():
+        if store is None:
+            doc = parse_contract(nlp, text, n_process=n_process)
+        else:
+            doc = store.get_or_parse(nlp, text, n_process=n_process)
+        return _encode_flags(flagger.flag(doc))
+
+    if cache is None:
+        return _decode_flags(compute())
+    return _decode_flags(cache.get_or_compute(_flags_key(digest, text, flagger), compute))
+
+
+def iter_pages(pdf_bytes):
+    """Yield (page_number, page_count, text) one PDF page at a time."""
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        page_count = doc.pageCount
+        for page in doc:
+            with span("extract") as counts:
+                text = page.getText()
+                counts["pages"] = 1
+                counts["characters"] = len(text)
+            yield page.number, page_count, text
+
+
+def stream_flags(pages, nlp, flagger, pieces=None):
+    """Flag (page_number, page_count, text) pages as they arrive, yielding PageFlags per page.
+
+    Only the current page and the unfinished last sentence of the previous one
+    are held in memory: that sentence is carried over and flagged with the
+    next page, so sentences running across a page break are not split. The
+    flagged part of each page's Doc is passed to pieces.add() if given (e.g.
+    a DocStore writer); together these pieces cover the whole text.
+
+    Pages are parsed one after another in this process: each parse needs the
+    previous page's carry, so they cannot be spread over nlp.pipe workers.
+    Use contract_flags(n_process=-1) where all cores matter more than
+    early results.
+    """
+    carry = ""
+    offset = 0
+    for page_number, page_count, text in pages:
+        with span("parse") as counts:
+            doc = nlp(carry + text)
+            counts["tokens"] = len(doc)
+            counts["sentences"] = sum(1 for _ in doc.sents)
+        base = offset - len(carry)
+        offset += len(text)
+
+        cut = len(doc.text)
+        cut_token = len(doc)
+        if page_number < page_count - 1:
+            sentences = list(doc.sents)
+            if sentences and cut - sentences[-1].start_char <= MAX_CARRY:
+                cut = sentences[-1].start_char
+                cut_token = sentences[-1].start
+        if pieces is not None and cut_token:
+            pieces.add(doc[:cut_token].as_doc())
+
+        flags = OrderedDict()
+        for category, category_flags in flagger.flag(doc).items():
+            flags[category] = [
+                flag._replace(start_char=base + flag.start_char, end_char=base + flag.end_char)
+                for flag in category_flags if flag.start_char < cut
+            ]
+        carry = doc.text[cut:]
+        yield PageFlags(page_number, page_count, text, flags)
+
+
+def stream_contract(pdf_bytes, digest, nlp, flagger, cache=None, store=None):
+    """Yield PageFlags page by page, then store the assembled text and flags in the cache.
+
+    A contract already in the cache comes back as a single PageFlags holding
+    the whole text and every flag. With a DocStore the parsed pages are
+    written to it as they finish (nothing accumulates in memory), so a
+    contract whose text is cached but whose flags are stale (the lexicon
+    changed) is only matched again, also as a single PageFlags.
+    """
+    if cache is not None:
+        text = cache.get(_text_key(digest))
+        flags = cache.get(_flags_key(digest, text, flagger)) if text is not None else None
+        if text is not None and flags is not None:
+            yield PageFlags(0, 1, text, _decode_flags(flags))
+            return
+        doc = store.get(nlp, text) if text is not None and store is not None else None
+        if doc is not None:
+            flags = flagger.flag(doc)
+            cache.put(_flags_key(digest, text, flagger), _encode_flags(flags))
+            yield PageFlags(0, 1, text, flags)
+            return
+
+    texts = []
+    merged = OrderedDict((category, []) for category in flagger.labels)
+    writer = store.writer() if store is not None else None
+    try:
+        for page in stream_flags(iter_pages(pdf_bytes), nlp, flagger, writer):
+            texts.append(page.text)
+            for category, category_flags in page.flags.items():
+                merged[category].extend(category_flags)
+            yield page
+    except BaseException:
+        # a stream that fails or is abandoned leaves no partial parse behind
+        if writer is not None:
+            writer.discard()
+        raise
+
+    text = "".join(texts)
+    if writer is not None:
+        writer.commit(nlp, text)
+    if cache is not None:
+        cache.put(_text_key(digest), text)
+        cache.put(_flags_key(digest, text, flagger), _encode_flags(merged))
+
+
+def contract_answers(text, digest, questions, model, cache=None, screen=None, screen_margin=None):
+    """run_prediction answers {qas_id: answer} for questions over the contract, cached per model version.
+
+    model is a ModelHandle, a model path, or an InferenceClient for a running inference service.
+    screen is an optional cheaper ModelHandle whose null-dominant windows model skips (see run_prediction),
+    by screen_margin or else the margin recorded for screen.
+    """
+    if isinstance(model, InferenceClient):
+        if screen is not None:
+            raise ValueError("window screening runs in-process; the inference service scores every window")
+        predict = model.predict
+        version = model.model_version
+    else:
+        if not isinstance(model, ModelHandle):
+            model = load_model(model)
+        if screen is not None and screen_margin is None:
+            screen_margin = recorded_screen_margin(screen)
+
+        def predict(questions, text):
+            return run_prediction(questions, text, model, screen=screen, screen_margin=screen_margin)
+
+        def version():
+            if screen is None:
+                return model_version(model)
+            return "{}+screen:{}@{}".format(model_version(model), model_version(screen), screen_margin)
+
+    with span("answers") as counts:
+        counts["questions"] = len(questions)
+        if cache is None:
+            return predict(questions, text)
+        # keyed on the text actually scored too, so answers over a partly read PDF are never reused
+        key = cache_key("answers", digest, _text_digest(text), version(), json.dumps(questions))
+        return cache.get_or_compute(key, lambda: predict(questions, text))
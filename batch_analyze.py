@@ -0,0 +1,183 @@
+"""Analyze a folder (or manifest) of contracts without Streamlit.
+
+Every PDF is extracted, flagged for ASC 606 terms and run through the CUAD
+questions; one JSON line per contract is appended to the output as soon as it
+finishes, so an interrupted run resumes where it stopped.
+
+    python batch_analyze.py contracts/ -o results.jsonl --workers 4
+    python batch_analyze.py manifest.txt -o results.jsonl --all-questions
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import torch
+
+from analysis import contract_answers, contract_flags, contract_text, load_questions, pdf_digest
+from doc_store import DOC_STORE_DIR, DocStore
+from flagging import FlaggingEngine
+from instrumentation import Tracer, prometheus_text, tracing
+from nlp_pipeline import load_nlp
+from predict import MODEL_PATH, load_model, recorded_screen_margin
+from qa_backends import BACKENDS
+from result_cache import CACHE_PATH, ResultCache
+
+# per-worker state, loaded once by _init_worker
+_worker = {}
+
+
+def find_contracts(source):
+    """PDF paths from a directory (recursively) or a manifest file with one path per line."""
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            paths.extend(os.path.join(root, name) for name in files if name.lower().endswith(".pdf"))
+        return sorted(paths)
+
+    with open(source) as manifest:
+        return [line.strip() for line in manifest if line.strip() and not line.startswith("#")]
+
+
+def completed_paths(output_path):
+    """Paths already recorded without error; a line cut short by a crash is ignored."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path) as output:
+        for line in output:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if not record.get("error"):
+                done.add(record["path"])
+    return done
+
+
+def _ends_with_newline(path):
+    with open(path, "rb") as output:
+        output.seek(-1, os.SEEK_END)
+        return output.read(1) == b"\n"
+
+
+def _init_worker(*args):
+    # an exception here would make Pool respawn the worker forever; report it from analyze_contract instead
+    try:
+        _load_worker(*args)
+    except Exception as error:
+        _worker["setup_error"] = "{}: {}".format(type(error).__name__, error)
+
+
+def _load_worker(model_path, backend, questions, threads, cache_path, store_path, screen_path, screen_margin):
+    # one model copy per worker; split the cores so workers do not oversubscribe them
+    torch.set_num_threads(threads)
+    nlp = load_nlp("flagging")
+    _worker["nlp"] = nlp
+    _worker["flagger"] = FlaggingEngine(nlp)
+    _worker["model"] = load_model(model_path, device="cpu", backend=backend)
+    _worker["screen"] = load_model(screen_path, device="cpu", backend=backend) if screen_path else None
+    if _worker["screen"] is not None and screen_margin is None:
+        screen_margin = recorded_screen_margin(_worker["screen"])
+    _worker["screen_margin"] = screen_margin
+    _worker["questions"] = questions
+    _worker["cache"] = ResultCache(cache_path) if cache_path else None
+    _worker["store"] = DocStore(store_path) if store_path else None
+
+
+def analyze_contract(path):
+    """(JSON record, timing spans) for one contract."""
+    started = time.perf_counter()
+    record = {"path": path}
+    tracer = Tracer()
+    if "setup_error" in _worker:
+        record["setup_error"] = _worker["setup_error"]
+        return record, []
+    try:
+        with open(path, "rb") as pdf_file:
+            pdf_bytes = pdf_file.read()
+        digest = pdf_digest(pdf_bytes)
+        cache = _worker["cache"]
+        with tracing(tracer):
+            text = contract_text(pdf_bytes, digest, cache)
+            flags = contract_flags(text, digest, _worker["nlp"], _worker["flagger"], cache, store=_worker["store"])
+            answers = contract_answers(text, digest, _worker["questions"], _worker["model"], cache,
+                                       _worker["screen"], _worker["screen_margin"])
+
+        record["sha256"] = digest
+        record["flags"] = {category: [flag._asdict() for flag in category_flags]
+                           for category, category_flags in flags.items() if category_flags}
+        record["answers"] = dict(zip(_worker["questions"], answers.values()))
+    except Exception as error:
+        record["error"] = "{}: {}".format(type(error).__name__, error)
+    record["seconds"] = time.perf_counter() - started
+    record["timings"] = tracer.totals()
+    return record, tracer.spans
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="directory of PDFs or a manifest file listing PDF paths")
+    parser.add_argument("-o", "--output", default="results.jsonl")
+    parser.add_argument("--workers", type=int, default=max(1, multiprocessing.cpu_count() // 4))
+    parser.add_argument("--all-questions", action="store_true", help="ask all 41 CUAD questions")
+    parser.add_argument("--model-path", default=MODEL_PATH)
+    parser.add_argument("--backend", default="pytorch", choices=BACKENDS)
+    parser.add_argument("--screen-model", help="cheaper model (see qa_variants.py) that skips windows with no answer")
+    parser.add_argument("--screen-margin", type=float,
+                        help="override the margin recorded for the screening model (see bench_all_questions)")
+    parser.add_argument("--cache", default=CACHE_PATH, help="result cache shared with the app ('' to disable)")
+    parser.add_argument("--doc-store", default=DOC_STORE_DIR,
+                        help="parsed contracts, reused when only the lexicon changed ('' to disable)")
+    parser.add_argument("--metrics", help="write per-stage timings of this run here as Prometheus text")
+    args = parser.parse_args()
+
+    paths = find_contracts(args.source)
+    done = completed_paths(args.output)
+    pending = [path for path in paths if path not in done]
+    print("{} contracts, {} already done, {} to analyze".format(len(paths), len(done), len(pending)),
+          file=sys.stderr)
+    if not pending:
+        return
+
+    questions = load_questions(indices=None) if args.all_questions else load_questions()
+    workers = max(1, min(args.workers, len(pending)))
+    threads = max(1, multiprocessing.cpu_count() // workers)
+    initargs = (args.model_path, args.backend, questions, threads, args.cache, args.doc_store,
+                args.screen_model, args.screen_margin)
+
+    failures = 0
+    spans = []
+    with open(args.output, "a") as output, \
+            multiprocessing.Pool(workers, initializer=_init_worker, initargs=initargs) as pool:
+        # terminate a line left half-written by a crash so the next record starts clean
+        if output.tell() and not _ends_with_newline(args.output):
+            output.write("\n")
+        for count, (record, record_spans) in enumerate(pool.imap_unordered(analyze_contract, pending), start=1):
+            if "setup_error" in record:
+                # a bad model path, backend or screening model fails every contract: stop instead of recording them
+                pool.terminate()
+                print("worker setup failed: " + record["setup_error"], file=sys.stderr)
+                sys.exit(2)
+            spans.extend(record_spans)
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+            os.fsync(output.fileno())
+            failures += bool(record.get("error"))
+            print("[{}/{}] {} {:.1f}s{}".format(
+                count, len(pending), record["path"], record["seconds"],
+                " ERROR " + record["error"] if record.get("error") else ""), file=sys.stderr)
+
+    if args.metrics:
+        with open(args.metrics, "w") as metrics_file:
+            metrics_file.write(prometheus_text(spans))
+
+    if failures:
+        print("{} contracts failed; rerun to retry them".format(failures), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""All 41 CUAD questions: full model vs a lighter variant vs screened (early-exit) runs.
+
+Every configuration answers every question of the CUAD test contracts and
+is scored per question category against the reference eval outputs:
+answers against cuad-models/predictions_.json and the answer/no-answer
+decision against cuad-models/null_odds_.json. The margin whose screened
+run is accurate enough is then recorded for the light model, which only
+screens in the app and batch runs once it has one.
+
+    python qa_variants.py --layers 6
+    python -m benchmarks.bench_all_questions --contracts 10 --light-model cuad-training/cuad-models-6l/
+    python qa_variants.py --record-margin 4.0 --output cuad-training/cuad-models-6l/
+"""
+import argparse
+import json
+import time
+from collections import OrderedDict, defaultdict
+
+from benchmarks.cuad import REFERENCE_NULL_ODDS_PATH, agreement, category, load_contracts, load_reference
+from instrumentation import Tracer, tracing
+from predict import MODEL_PATH, NULL_SCORE_DIFF_THRESHOLD, load_model, run_prediction
+from qa_backends import BACKENDS
+
+
+def null_agreement(null_odds, reference_null_odds, threshold=NULL_SCORE_DIFF_THRESHOLD):
+    """Share of questions where the answer/no-answer decision matches the reference null odds."""
+    qas_ids = [qas_id for qas_id in null_odds if qas_id in reference_null_odds]
+    if not qas_ids:
+        return 0.0
+    return sum((null_odds[q] > threshold) == (reference_null_odds[q] > threshold) for q in qas_ids) / len(qas_ids)
+
+
+def run_config(contracts, model, screen=None, screen_margin=None):
+    predictions = {}
+    null_odds = {}
+    tracer = Tracer()
+    kwargs = {} if screen is None else {"screen": screen, "screen_margin": screen_margin}
+    started = time.perf_counter()
+    with tracing(tracer):
+        for contract in contracts:
+            answers, odds = run_prediction(contract.questions, contract.context, model, with_null_odds=True, **kwargs)
+            predictions.update(zip(contract.qas_ids, answers.values()))
+            null_odds.update(zip(contract.qas_ids, odds.values()))
+    seconds = time.perf_counter() - started
+
+    totals = tracer.totals()
+    windows = totals["features"]["features"]
+    scored = totals["inference"]["features"]
+    return predictions, null_odds, seconds, scored / windows if windows else 0.0
+
+
+def by_category(predictions, null_odds, reference, reference_null_odds):
+    grouped = defaultdict(list)
+    for qas_id in predictions:
+        grouped[category(qas_id)].append(qas_id)
+
+    scores = OrderedDict()
+    for name in sorted(grouped):
+        qas_ids = grouped[name]
+        scores[name] = agreement({q: predictions[q] for q in qas_ids}, reference)
+        scores[name]["null_agreement"] = null_agreement({q: null_odds[q] for q in qas_ids}, reference_null_odds)
+    return scores
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--contracts", type=int, default=10, help="number of CUAD test contracts to run")
+    parser.add_argument("--model-path", default=MODEL_PATH)
+    parser.add_argument("--light-model", help="lighter variant to run alone and as the screening model")
+    parser.add_argument("--margins", type=float, nargs="+", default=[2.0, 4.0, 8.0],
+                        help="screening margins to try with the light model")
+    parser.add_argument("--backend", default="pytorch", choices=BACKENDS)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    contracts = load_contracts(limit=args.contracts)
+    reference = load_reference()
+    reference_null_odds = load_reference(REFERENCE_NULL_ODDS_PATH)
+
+    model = load_model(args.model_path, device=args.device, backend=args.backend)
+    configs = [("full", model, None, None)]
+    if args.light_model:
+        light = load_model(args.light_model, device=args.device, backend=args.backend)
+        configs.append(("light", light, None, None))
+        configs.extend(("screen@{:g}".format(margin), model, light, margin) for margin in args.margins)
+
+    results = OrderedDict()
+    for name, config_model, screen, margin in configs:
+        predictions, null_odds, seconds, scored = run_config(contracts, config_model, screen, margin)
+        overall = agreement(predictions, reference)
+        overall["null_agreement"] = null_agreement(null_odds, reference_null_odds)
+        results[name] = {
+            "seconds_per_contract": seconds / len(contracts),
+            "windows_scored": scored,
+            "overall": overall,
+            "categories": by_category(predictions, null_odds, reference, reference_null_odds),
+        }
+
+    names = list(results)
+    categories = list(results["full"]["categories"])
+    print("F1 against predictions_.json per question")
+    print("{:<40}".format("category") + "".join("{:>12}".format(name) for name in names))
+    for name in categories:
+        print("{:<40}".format(name[:39]) + "".join(
+            "{:>12.3f}".format(results[config]["categories"][name]["f1"]) for config in names))
+
+    print()
+    print("{:<40}".format("") + "".join("{:>12}".format(name) for name in names))
+    rows = [
+        ("s/contract", lambda result: result["seconds_per_contract"], "{:>12.2f}"),
+        ("windows scored (final model)", lambda result: result["windows_scored"], "{:>12.1%}"),
+        ("EM", lambda result: result["overall"]["exact"], "{:>12.3f}"),
+        ("F1", lambda result: result["overall"]["f1"], "{:>12.3f}"),
+        ("has-answer agreement", lambda result: result["overall"]["has_answer_agreement"], "{:>12.3f}"),
+        ("null odds decision agreement", lambda result: result["overall"]["null_agreement"], "{:>12.3f}"),
+    ]
+    for label, value, fmt in rows:
+        print("{:<40}".format(label) + "".join(fmt.format(value(results[config])) for config in names))
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(results, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""Time every stage of the contract analysis pipeline in isolation, without Streamlit or network.
+
+Each stage runs on the previous stage's output, computed outside its timer:
+PDF extraction, spaCy parse, flagging, QA feature conversion, inference and
+decoding. Synthetic contracts of increasing size are generated on the fly;
+--pdf adds sample contracts. Results can be saved as a JSON baseline and
+later runs compared against it.
+
+    python -m benchmarks.bench_pipeline --pages 5 20 50 --save-baseline baseline.json
+    python -m benchmarks.bench_pipeline --pdf contract.pdf --compare baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import time
+
+import torch
+
+from analysis import extract_text, load_questions
+from benchmarks.synthetic import synthetic_pdf
+from flagging import FlaggingEngine
+from nlp_pipeline import load_nlp, parse_contract
+from predict import (
+    DOC_STRIDE,
+    MAX_ANSWER_LENGTH,
+    MAX_QUERY_LENGTH,
+    MAX_SEQ_LENGTH,
+    MODEL_PATH,
+    NULL_SCORE_DIFF_THRESHOLD,
+    load_model,
+)
+from qa_backends import BACKENDS
+from qa_decode import decode_predictions
+from qa_features import convert_questions_to_features
+from qa_inference import run_inference
+
+STAGES = ["extract", "parse", "flag", "features", "inference", "decode"]
+# a stage this much slower than the baseline is reported as a regression
+TOLERANCE = 0.2
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def time_stage(run, repeat):
+    """(best seconds, result, growth of the process peak RSS in MB) over repeat runs of run()."""
+    rss_before = peak_rss_mb()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = run()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result, peak_rss_mb() - rss_before
+
+
+def bench_contract(name, pdf_bytes, nlp, flagger, handle, questions, repeat):
+    stages = {}
+
+    def record(stage, run, tokens):
+        seconds, result, rss_growth = time_stage(run, repeat)
+        stages[stage] = {
+            "seconds": seconds,
+            "tokens_per_second": tokens(result) / seconds if seconds else 0.0,
+            "peak_rss_mb": peak_rss_mb(),
+            "peak_rss_growth_mb": rss_growth,
+        }
+        return result
+
+    # extraction counts words, spaCy stages doc tokens, QA stages model tokens (non-padding window positions)
+    text = record("extract", lambda: extract_text(pdf_bytes), lambda text: len(text.split()))
+    doc = record("parse", lambda: parse_contract(nlp, text), len)
+    flags = record("flag", lambda: flagger.flag(doc), lambda _: len(doc))
+    examples, features, dataset = record(
+        "features",
+        lambda: convert_questions_to_features(
+            questions, text, handle.tokenizer, MAX_SEQ_LENGTH, DOC_STRIDE, MAX_QUERY_LENGTH),
+        lambda result: int(result[2].tensors[1].sum()))
+    model_tokens = int(dataset.tensors[1].sum())
+    start_logits, end_logits = record(
+        "inference", lambda: run_inference(handle, dataset, MAX_SEQ_LENGTH), lambda _: model_tokens)
+    record(
+        "decode",
+        lambda: decode_predictions(
+            examples, features, start_logits, end_logits, handle.tokenizer,
+            max_answer_length=MAX_ANSWER_LENGTH, null_score_diff_threshold=NULL_SCORE_DIFF_THRESHOLD),
+        lambda _: model_tokens)
+
+    stages["extract"]["characters"] = len(text)
+    stages["parse"]["sentences"] = sum(1 for _ in doc.sents)
+    stages["flag"]["flagged_sentences"] = sum(len(category_flags) for category_flags in flags.values())
+    stages["features"]["windows"] = len(features)
+    return {"contract": name, "tokens": len(doc), "stages": stages}
+
+
+def compare(results, baseline, tolerance):
+    """Print per-stage time ratios against baseline; return the regressions found."""
+    previous = {result["contract"]: result["stages"] for result in baseline["results"]}
+    regressions = []
+    print("\n{:<24} {:<10} {:>10} {:>10} {:>8}".format("contract", "stage", "baseline s", "now s", "ratio"))
+    for result in results:
+        for stage, timing in result["stages"].items():
+            before = previous.get(result["contract"], {}).get(stage)
+            if before is None:
+                continue
+            ratio = timing["seconds"] / before["seconds"] if before["seconds"] else float("inf")
+            regressed = ratio > 1 + tolerance
+            if regressed:
+                regressions.append((result["contract"], stage, ratio))
+            print("{:<24} {:<10} {:>10.3f} {:>10.3f} {:>7.2f}x{}".format(
+                result["contract"], stage, before["seconds"], timing["seconds"], ratio,
+                " REGRESSION" if regressed else ""))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="*", default=[5, 20, 50], help="synthetic contract sizes")
+    parser.add_argument("--pdf", nargs="*", default=[], help="sample contracts to include")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--all-questions", action="store_true", help="ask all 41 CUAD questions")
+    parser.add_argument("--model-path", default=MODEL_PATH)
+    parser.add_argument("--backend", default="pytorch", choices=BACKENDS)
+    parser.add_argument("--threads", type=int, help="torch intra-op threads (default: torch's choice)")
+    parser.add_argument("--save-baseline", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="compare against a JSON baseline; exit 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    nlp = load_nlp("flagging")
+    flagger = FlaggingEngine(nlp)
+    handle = load_model(args.model_path, device="cpu", backend=args.backend)
+    questions = load_questions(indices=None) if args.all_questions else load_questions()
+
+    contracts = [("synthetic-{}p".format(pages), synthetic_pdf(pages)) for pages in args.pages]
+    for path in args.pdf:
+        with open(path, "rb") as pdf_file:
+            contracts.append((os.path.basename(path), pdf_file.read()))
+
+    results = []
+    print("{:<24} {:<10} {:>9} {:>12} {:>9} {:>9}".format(
+        "contract", "stage", "seconds", "tokens/sec", "peak MB", "+MB"))
+    for name, pdf_bytes in contracts:
+        result = bench_contract(name, pdf_bytes, nlp, flagger, handle, questions, args.repeat)
+        results.append(result)
+        for stage in STAGES:
+            timing = result["stages"][stage]
+            print("{:<24} {:<10} {:>9.3f} {:>12.0f} {:>9.0f} {:>9.0f}".format(
+                name, stage, timing["seconds"], timing["tokens_per_second"], timing["peak_rss_mb"],
+                timing["peak_rss_growth_mb"]))
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "threads": torch.get_num_threads(),
+            "machine": platform.machine(),
+            "backend": args.backend,
+            "questions": len(questions),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as json_file:
+            json.dump(report, json_file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as json_file:
+            regressions = compare(results, json.load(json_file), args.tolerance)
+        if regressions:
+            print("{} stage(s) regressed by more than {:.0%}".format(len(regressions), args.tolerance))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Tune the retrieval prefilter: windows scored, speed and recall per top_k on the CUAD test set.
+
+Recall is the share of reference answers (cuad-models/predictions_.json)
+lying in a retrieved region; agreement is reported against the reference
+and against unfiltered run_prediction.
+
+    python -m benchmarks.bench_prefilter --contracts 10 --top-k 1 3 5 10
+"""
+import argparse
+import json
+import time
+
+from benchmarks.cuad import agreement, load_contracts, load_reference
+from nlp_pipeline import load_nlp, parse_contract
+from predict import DOC_STRIDE, MAX_QUERY_LENGTH, MAX_SEQ_LENGTH, MODEL_PATH, load_model, run_prediction
+from qa_features import convert_questions_to_features, select_features
+from retrieval import PASSAGE_SENTENCES, RelevancePrefilter
+
+
+class _FixedTopK:
+    # the same prefilter at a different top_k, without rebuilding the index
+    def __init__(self, prefilter, top_k):
+        self.prefilter = prefilter
+        self.top_k = top_k
+
+    def regions(self, question):
+        return self.prefilter.regions(question, self.top_k)
+
+
+def retrieval_recall(contract, reference, prefilter):
+    hits = total = 0
+    for qas_id, question in zip(contract.qas_ids, contract.questions):
+        answer = reference.get(qas_id)
+        start = contract.context.find(answer) if answer else -1
+        if start < 0:
+            continue
+        end = start + len(answer)
+        total += 1
+        hits += any(region_start < end and start < region_end
+                    for region_start, region_end in prefilter.regions(question))
+    return hits, total
+
+
+def predict_contracts(handle, contracts, prefilters):
+    predictions = {}
+    windows = 0
+    started = time.perf_counter()
+    for contract, prefilter in zip(contracts, prefilters):
+        answers = run_prediction(contract.questions, contract.context, handle, prefilter=prefilter)
+        predictions.update(zip(contract.qas_ids, answers.values()))
+    seconds = time.perf_counter() - started
+
+    for contract, prefilter in zip(contracts, prefilters):
+        examples, features, _ = convert_questions_to_features(
+            contract.questions, contract.context, handle.tokenizer, MAX_SEQ_LENGTH, DOC_STRIDE, MAX_QUERY_LENGTH)
+        if prefilter is None:
+            windows += len(features)
+        else:
+            windows += len(select_features(
+                examples, features, [prefilter.regions(question) for question in contract.questions]))
+    return predictions, seconds, windows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--contracts", type=int, default=10, help="number of CUAD test contracts to run")
+    parser.add_argument("--top-k", type=int, nargs="+", default=[1, 3, 5, 10])
+    parser.add_argument("--passage-sentences", type=int, default=PASSAGE_SENTENCES)
+    parser.add_argument("--model-path", default=MODEL_PATH)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--backend", default="pytorch")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    contracts = load_contracts(limit=args.contracts)
+    reference = load_reference()
+    handle = load_model(args.model_path, device=args.device, backend=args.backend)
+    nlp = load_nlp("flagging")
+
+    started = time.perf_counter()
+    indexes = [RelevancePrefilter(nlp, parse_contract(nlp, contract.context),
+                                  passage_sentences=args.passage_sentences) for contract in contracts]
+    index_seconds = time.perf_counter() - started
+
+    baseline, baseline_seconds, all_windows = predict_contracts(handle, contracts, [None] * len(contracts))
+    results = []
+    for top_k in args.top_k:
+        prefilters = [_FixedTopK(index, top_k) for index in indexes]
+        predictions, seconds, windows = predict_contracts(handle, contracts, prefilters)
+        hits, total = map(sum, zip(*(retrieval_recall(contract, reference, prefilter)
+                                     for contract, prefilter in zip(contracts, prefilters))))
+        results.append({
+            "top_k": top_k,
+            "windows_scored": windows / all_windows,
+            "speedup": baseline_seconds / seconds,
+            "seconds_per_contract": seconds / len(contracts),
+            "recall": hits / total if total else 1.0,
+            "vs_reference": agreement(predictions, reference),
+            "vs_unfiltered": agreement(predictions, baseline),
+        })
+
+    print("index build {:.2f} s/contract, unfiltered {:.2f} s/contract, F1 ref {:.3f}".format(
+        index_seconds / len(contracts), baseline_seconds / len(contracts),
+        agreement(baseline, reference)["f1"]))
+    print("{:>5} {:>8} {:>8} {:>8} {:>8} {:>12}".format(
+        "top_k", "windows", "speedup", "recall", "F1 ref", "F1 unfilt"))
+    for result in results:
+        print("{:>5} {:>8.1%} {:>7.2f}x {:>8.3f} {:>8.3f} {:>12.3f}".format(
+            result["top_k"], result["windows_scored"], result["speedup"], result["recall"],
+            result["vs_reference"]["f1"], result["vs_unfiltered"]["f1"]))
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({"index_seconds_per_contract": index_seconds / len(contracts),
+                       "unfiltered_seconds_per_contract": baseline_seconds / len(contracts),
+                       "results": results}, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Compare QA inference backends for speed and accuracy on the CUAD test set.
+
+Accuracy is measured against the reference CUAD eval predictions
+(cuad-models/predictions_.json) and against the fp32 pytorch backend.
+
+    python -m benchmarks.bench_qa_backends --contracts 10
+    python -m benchmarks.bench_qa_backends --backends pytorch quantized
+"""
+import argparse
+import json
+import time
+
+from benchmarks.cuad import agreement, load_contracts, load_reference
+from predict import MODEL_PATH, load_model, run_prediction
+from qa_backends import BACKENDS
+
+
+def predict_contracts(handle, contracts):
+    predictions = {}
+    started = time.perf_counter()
+    for contract in contracts:
+        answers = run_prediction(contract.questions, contract.context, handle)
+        predictions.update(zip(contract.qas_ids, answers.values()))
+    return predictions, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--contracts", type=int, default=10, help="number of CUAD test contracts to run")
+    parser.add_argument("--model-path", default=MODEL_PATH)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    contracts = load_contracts(limit=args.contracts)
+    reference = load_reference()
+
+    results = []
+    baseline = None
+    for backend in args.backends:
+        started = time.perf_counter()
+        handle = load_model(args.model_path, device=args.device, backend=backend)
+        load_seconds = time.perf_counter() - started
+
+        predictions, seconds = predict_contracts(handle, contracts)
+        if baseline is None and backend == "pytorch":
+            baseline = predictions
+
+        result = {
+            "backend": backend,
+            "load_seconds": load_seconds,
+            "seconds_per_contract": seconds / len(contracts),
+            "vs_reference": agreement(predictions, reference),
+        }
+        if baseline is not None:
+            result["vs_pytorch"] = agreement(predictions, baseline)
+        results.append(result)
+
+    print("{:<10} {:>8} {:>12} {:>10} {:>10} {:>12}".format(
+        "backend", "load s", "s/contract", "EM ref", "F1 ref", "F1 pytorch"))
+    for result in results:
+        vs_pytorch = result.get("vs_pytorch", {}).get("f1")
+        print("{:<10} {:>8.1f} {:>12.2f} {:>10.3f} {:>10.3f} {:>12}".format(
+            result["backend"], result["load_seconds"], result["seconds_per_contract"],
+            result["vs_reference"]["exact"], result["vs_reference"]["f1"],
+            "-" if vs_pytorch is None else "{:.3f}".format(vs_pytorch)))
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(results, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Compare spaCy pipeline profiles on the flagging path.
+
+    python -m benchmarks.bench_spacy_profiles --pages 50
+    python -m benchmarks.bench_spacy_profiles --pdf contract.pdf --repeat 5
+"""
+import argparse
+import json
+import time
+
+from benchmarks.synthetic import pdf_text, synthetic_contract
+from flagging import FlaggingEngine
+from nlp_pipeline import PROFILES, load_nlp, parse_contract
+
+
+def bench_profile(profile, text, repeat):
+    nlp = load_nlp(profile)
+    flagger = FlaggingEngine(nlp)
+    parse_contract(nlp, text[:2000])
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        doc = parse_contract(nlp, text)
+        timings.append(time.perf_counter() - started)
+
+    best = min(timings)
+    flags = flagger.flag(doc)
+    return {
+        "profile": profile,
+        "components": nlp.pipe_names,
+        "best_seconds": best,
+        "tokens_per_second": len(doc) / best,
+        "sentences": sum(1 for _ in doc.sents),
+        "flagged_sentences": sum(len(category_flags) for category_flags in flags.values()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", help="benchmark a real contract instead of a synthetic one")
+    parser.add_argument("--pages", type=int, default=50, help="size of the synthetic contract")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    text = pdf_text(args.pdf) if args.pdf else synthetic_contract(args.pages)
+    results = [bench_profile(profile, text, args.repeat) for profile in PROFILES]
+
+    baseline = results[0]["best_seconds"]
+    print("{:<10} {:>9} {:>12} {:>10} {:>8} {:>8}".format(
+        "profile", "seconds", "tokens/sec", "sentences", "flags", "speedup"))
+    for result in results:
+        print("{:<10} {:>9.3f} {:>12.0f} {:>10} {:>8} {:>7.2f}x".format(
+            result["profile"], result["best_seconds"], result["tokens_per_second"],
+            result["sentences"], result["flagged_sentences"], baseline / result["best_seconds"]))
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(results, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
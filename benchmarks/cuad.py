@@ -0,0 +1,70 @@
+import json
+import re
+import string
+from collections import Counter, namedtuple
+
+CUAD_TEST_PATH = "cuad-training/cuad-data/test.json"
+REFERENCE_PREDICTIONS_PATH = "cuad-training/cuad-models/predictions_.json"
+REFERENCE_NULL_ODDS_PATH = "cuad-training/cuad-models/null_odds_.json"
+
+# one CUAD contract: qas_ids are "<title>__<category>", aligned with questions
+Contract = namedtuple("Contract", ["title", "context", "qas_ids", "questions"])
+
+
+def load_contracts(path=CUAD_TEST_PATH, limit=None):
+    with open(path) as json_file:
+        data = json.load(json_file)
+
+    contracts = []
+    for document in data["data"][:limit]:
+        paragraph = document["paragraphs"][0]
+        contracts.append(Contract(
+            document["title"],
+            paragraph["context"],
+            [qa["id"] for qa in paragraph["qas"]],
+            [qa["question"] for qa in paragraph["qas"]],
+        ))
+    return contracts
+
+
+def load_reference(path=REFERENCE_PREDICTIONS_PATH):
+    with open(path) as json_file:
+        return json.load(json_file)
+
+
+def category(qas_id):
+    return qas_id.split("__", 1)[1]
+
+
+def normalize_answer(text):
+    # SQuAD normalization: lower case, no punctuation, articles or extra whitespace
+    text = "".join(ch for ch in text.lower() if ch not in set(string.punctuation))
+    text = re.sub(r"\b(a|an|the)\b", " ", text)
+    return " ".join(text.split())
+
+
+def f1_score(prediction, reference):
+    prediction_tokens = normalize_answer(prediction).split()
+    reference_tokens = normalize_answer(reference).split()
+    if not prediction_tokens or not reference_tokens:
+        return float(prediction_tokens == reference_tokens)
+    common = sum((Counter(prediction_tokens) & Counter(reference_tokens)).values())
+    if common == 0:
+        return 0.0
+    precision = common / len(prediction_tokens)
+    recall = common / len(reference_tokens)
+    return 2 * precision * recall / (precision + recall)
+
+
+def agreement(predictions, reference):
+    """Exact match, token F1 and has-answer agreement of predictions against reference answers."""
+    qas_ids = [qas_id for qas_id in predictions if qas_id in reference]
+    if not qas_ids:
+        return {"questions": 0, "exact": 0.0, "f1": 0.0, "has_answer_agreement": 0.0}
+    return {
+        "questions": len(qas_ids),
+        "exact": sum(normalize_answer(predictions[q]) == normalize_answer(reference[q]) for q in qas_ids)
+        / len(qas_ids),
+        "f1": sum(f1_score(predictions[q], reference[q]) for q in qas_ids) / len(qas_ids),
+        "has_answer_agreement": sum(bool(predictions[q]) == bool(reference[q]) for q in qas_ids) / len(qas_ids),
+    }
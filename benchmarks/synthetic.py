@@ -0,0 +1,51 @@
+import random
+
+from lexicon import load_lexicon
+
+_CLAUSES = [
+    "The Supplier shall deliver the Products to the Customer in accordance with Exhibit {n}.",
+    "Any {phrase} under this Agreement shall be agreed in writing by both Parties.",
+    "The Customer may request a {phrase} no later than thirty (30) days after the Effective Date.",
+    "Notwithstanding Section {n}, the {phrase} provisions survive termination of this Agreement.",
+    "Each Party shall bear its own costs in connection with the negotiation of this Agreement.",
+    "This Agreement is governed by the laws of the State of Washington.",
+    "All notices must be delivered by hand or by certified mail to the addresses set out above.",
+]
+
+
+def synthetic_contract(pages, seed=0, paragraphs_per_page=6, sentences_per_paragraph=5):
+    """Build a deterministic contract-like text of roughly `pages` pages seeded with lexicon terms."""
+    rng = random.Random(seed)
+    phrases = [phrase for category in load_lexicon() for phrase in category["phrases"]]
+
+    page_texts = []
+    for _ in range(pages):
+        paragraphs = []
+        for _ in range(paragraphs_per_page):
+            sentences = [
+                rng.choice(_CLAUSES).format(n=rng.randint(1, 40), phrase=rng.choice(phrases))
+                for _ in range(sentences_per_paragraph)
+            ]
+            paragraphs.append(" ".join(sentences))
+        page_texts.append("\n\n".join(paragraphs) + "\n")
+    return "\f".join(page_texts)
+
+
+def synthetic_pdf(pages, seed=0):
+    """synthetic_contract(pages, seed) laid out one page per PDF page, as PDF bytes."""
+    import fitz
+
+    doc = fitz.open()
+    for page_text in synthetic_contract(pages, seed).split("\f"):
+        page = doc.newPage()
+        page.insertTextbox(page.rect + (36, 36, -36, -36), page_text, fontsize=7)
+    data = doc.write()
+    doc.close()
+    return data
+
+
+def pdf_text(path):
+    import fitz
+
+    with fitz.open(path) as doc:
+        return "".join(page.getText() for page in doc)
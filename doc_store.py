@@ -0,0 +1,96 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+from spacy.tokens import Doc, DocBin
+
+from instrumentation import span
+from nlp_pipeline import parse_contract, pipeline_version
+
+DOC_STORE_DIR = ".cache/docs"
+
+
+class DocWriter:
+    """Pieces of one parse written to disk as they are added, stored under the text once it is known.
+
+    Nothing is kept in memory between add() calls. The pieces become visible
+    to DocStore.get only on commit(); discard() drops an unfinished parse.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        os.makedirs(store.path, exist_ok=True)
+        self.path = tempfile.mkdtemp(prefix="tmp-", dir=store.path)
+        self.count = 0
+
+    def add(self, doc):
+        DocBin(docs=[doc]).to_disk(os.path.join(self.path, "{:06d}.spacy".format(self.count)))
+        self.count += 1
+
+    def commit(self, nlp, text):
+        """Store the pieces added so far, whose texts concatenate to text, as the parse of text."""
+        path = self.store._dir(self.store.key(nlp, text))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            # rename the whole directory so readers never see a partial parse
+            os.rename(self.path, path)
+        except OSError:
+            # another process stored the same text first
+            self.discard()
+
+    def discard(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class DocStore:
+    """Parsed contracts serialized with DocBin, keyed by text hash and pipeline version.
+
+    A contract is parsed once per spaCy pipeline; flagging it again after a
+    lexicon change, or retrieving over it, only loads the stored Doc. Each
+    entry is a directory of DocBin pieces, read back only when requested.
+    """
+
+    def __init__(self, path=DOC_STORE_DIR):
+        self.path = path
+
+    def key(self, nlp, text):
+        return hashlib.sha256(text.encode()).hexdigest() + "-" + pipeline_version(nlp)
+
+    def _dir(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def get(self, nlp, text):
+        """The stored Doc for text, or None. Its pieces are joined back into one Doc aligned with text."""
+        path = self._dir(self.key(nlp, text))
+        try:
+            names = sorted(name for name in os.listdir(path) if name.endswith(".spacy"))
+        except FileNotFoundError:
+            return None
+
+        with span("doc_store_load") as counts:
+            docs = []
+            for name in names:
+                docs.extend(DocBin().from_disk(os.path.join(path, name)).get_docs(nlp.vocab))
+            if not docs:
+                doc = nlp.make_doc(text)
+            elif len(docs) == 1:
+                doc = docs[0]
+            else:
+                doc = Doc.from_docs(docs, ensure_whitespace=False)
+            counts["pieces"] = len(names)
+            counts["tokens"] = len(doc)
+        return doc
+
+    def writer(self):
+        return DocWriter(self)
+
+    def get_or_parse(self, nlp, text, n_process=1):
+        """The stored Doc for text, parsing and storing it on a miss."""
+        doc = self.get(nlp, text)
+        if doc is None:
+            doc = parse_contract(nlp, text, n_process=n_process)
+            writer = self.writer()
+            writer.add(doc)
+            writer.commit(nlp, text)
+        return doc
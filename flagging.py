@@ -0,0 +1,50 @@
+from collections import OrderedDict, namedtuple
+
+from spacy.matcher import PhraseMatcher
+
+from instrumentation import span
+from lexicon import LEXICON_PATH, load_compiled_lexicon
+
+# one flagged sentence; start_char/end_char index into doc.text
+Flag = namedtuple("Flag", ["category", "sentence", "start_char", "end_char", "terms"])
+
+
+class FlaggingEngine:
+    """Flags ASC 606 relevant sentences for every category in a single matcher pass."""
+
+    def __init__(self, nlp, lexicon_path=LEXICON_PATH):
+        self.nlp = nlp
+        self.version, categories = load_compiled_lexicon(nlp, lexicon_path)
+        self.labels = OrderedDict()
+        self.matcher = PhraseMatcher(nlp.vocab, attr="LEMMA")
+        for category in categories:
+            self.labels[category.id] = category.label
+            self.matcher.add(category.id, category.patterns)
+
+    def flag(self, doc):
+        """Return {category: [Flag, ...]} in category order, sentences in document order."""
+        with span("flag_match") as counts:
+            matches = self.matcher(doc)
+            counts["tokens"] = len(doc)
+            counts["matches"] = len(matches)
+
+        by_category = OrderedDict((category, []) for category in self.labels)
+        for match_id, start, end in matches:
+            by_category[self.nlp.vocab.strings[match_id]].append((start, end))
+
+        results = OrderedDict()
+        for category, category_matches in by_category.items():
+            with span("flag_category", category=category) as counts:
+                sentences = OrderedDict()
+                for start, end in category_matches:
+                    sent = doc[start].sent
+                    if sent.start_char not in sentences:
+                        sentences[sent.start_char] = (sent, [])
+                    sentences[sent.start_char][1].append(doc[start:end].text)
+                results[category] = [
+                    Flag(category, sent.text, sent.start_char, sent.end_char, terms)
+                    for _, (sent, terms) in sorted(sentences.items())
+                ]
+                counts["matches"] = len(category_matches)
+                counts["sentences"] = len(results[category])
+        return results
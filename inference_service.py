@@ -0,0 +1,239 @@
+"""Local CUAD inference service shared by every Streamlit session and worker.
+
+One process owns the model. Jobs of (questions, context) arrive over
+newline-delimited JSON on a localhost TCP socket; their windows are queued
+and coalesced with other jobs' windows into shared, length-bucketed batches,
+and each answer is streamed back as soon as all windows of its question are
+scored.
+
+    python inference_service.py --port 8765 --backend quantized
+    QA_SERVICE=127.0.0.1:8765 streamlit run streamlit_app.py
+"""
+import argparse
+import asyncio
+import json
+import socket
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+from torch.utils.data import TensorDataset
+
+from predict import (
+    DOC_STRIDE,
+    MAX_ANSWER_LENGTH,
+    MAX_QUERY_LENGTH,
+    MAX_SEQ_LENGTH,
+    MODEL_PATH,
+    NULL_SCORE_DIFF_THRESHOLD,
+    load_model,
+    model_version,
+)
+from qa_backends import BACKENDS
+from qa_decode import decode_predictions
+from qa_features import convert_questions_to_features
+from qa_inference import TOKEN_BUDGET, run_inference
+
+HOST = "127.0.0.1"
+PORT = 8765
+# how long a batch waits for other jobs' windows before running part-full
+MAX_WAIT = 0.02
+# a request line carries the whole contract text
+MAX_REQUEST_BYTES = 64 * 1024 * 1024
+
+
+class _Job:
+    """Features and logits of one (questions, context) request while its windows are scored."""
+
+    def __init__(self, examples, features, dataset):
+        self.examples = examples
+        self.features = features
+        self.dataset = dataset
+        self.lengths = dataset.tensors[1].sum(dim=1).tolist()
+        self.start_logits = torch.empty(len(features), MAX_SEQ_LENGTH)
+        self.end_logits = torch.empty(len(features), MAX_SEQ_LENGTH)
+        self.remaining = Counter(feature.example_index for feature in features)
+        # example indices whose windows are all scored, or an exception
+        self.events = asyncio.Queue()
+
+    def scored(self, rows, start_logits, end_logits):
+        self.start_logits[rows] = start_logits
+        self.end_logits[rows] = end_logits
+        for row in rows:
+            example_index = self.features[row].example_index
+            self.remaining[example_index] -= 1
+            if self.remaining[example_index] == 0:
+                self.events.put_nowait(example_index)
+
+
+class InferenceService:
+    """Accepts jobs from many clients and micro-batches their windows through one model."""
+
+    def __init__(self, handle, token_budget=TOKEN_BUDGET, max_wait=MAX_WAIT):
+        self.handle = handle
+        self.token_budget = token_budget
+        self.max_wait = max_wait
+        self.version = model_version(handle)
+        self._queue = asyncio.Queue()
+        # tokenization and forward passes run off the event loop, one at a time each
+        self._feature_executor = ThreadPoolExecutor(1)
+        self._model_executor = ThreadPoolExecutor(1)
+
+    async def answers(self, questions, context):
+        """Yield (question index, answer) pairs as each question's windows finish."""
+        loop = asyncio.get_running_loop()
+        examples, features, dataset = await loop.run_in_executor(
+            self._feature_executor, convert_questions_to_features, questions, context, self.handle.tokenizer,
+            MAX_SEQ_LENGTH, DOC_STRIDE, MAX_QUERY_LENGTH)
+        if not features:
+            for index in range(len(examples)):
+                yield index, ""
+            return
+
+        job = _Job(examples, features, dataset)
+        # queue the job in slices so a long contract cannot hold up a short one for a whole pass
+        rows_per_slice = max(1, self.token_budget // MAX_SEQ_LENGTH)
+        for start in range(0, len(features), rows_per_slice):
+            self._queue.put_nowait((job, list(range(start, min(start + rows_per_slice, len(features))))))
+
+        for _ in range(len(examples)):
+            event = await job.events.get()
+            if isinstance(event, Exception):
+                raise event
+            yield event, self._decode(job, event)
+
+    def _decode(self, job, example_index):
+        rows = [row for row, feature in enumerate(job.features) if feature.example_index == example_index]
+        predictions, _ = decode_predictions(
+            job.examples,
+            [job.features[row] for row in rows],
+            job.start_logits[rows],
+            job.end_logits[rows],
+            self.handle.tokenizer,
+            max_answer_length=MAX_ANSWER_LENGTH,
+            null_score_diff_threshold=NULL_SCORE_DIFF_THRESHOLD,
+            example_indices={example_index},
+        )
+        return predictions[job.examples[example_index].qas_id]
+
+    async def run_batches(self):
+        """Forever: gather queued windows from any jobs up to the token budget and score them together."""
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self._queue.get()]
+            tokens = sum(pending[0][0].lengths[row] for row in pending[0][1])
+            deadline = loop.time() + self.max_wait
+            while tokens < self.token_budget:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    job, rows = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                pending.append((job, rows))
+                tokens += sum(job.lengths[row] for row in rows)
+
+            dataset = TensorDataset(*(
+                torch.cat([job.dataset.tensors[i][rows] for job, rows in pending]) for i in range(3)))
+            try:
+                start_logits, end_logits = await loop.run_in_executor(
+                    self._model_executor, run_inference, self.handle, dataset, MAX_SEQ_LENGTH, self.token_budget)
+            except Exception as error:
+                for job, _ in pending:
+                    job.events.put_nowait(error)
+                continue
+
+            offset = 0
+            for job, rows in pending:
+                job.scored(rows, start_logits[offset:offset + len(rows)], end_logits[offset:offset + len(rows)])
+                offset += len(rows)
+
+    async def handle_client(self, reader, writer):
+        def send(message):
+            writer.write((json.dumps(message) + "\n").encode())
+
+        try:
+            request = json.loads(await reader.readline())
+            if request.get("type") == "info":
+                send({"model_version": self.version, "backend": self.handle.backend})
+            else:
+                started = time.perf_counter()
+                async for index, answer in self.answers(request["questions"], request["context"]):
+                    send({"index": index, "answer": answer})
+                    await writer.drain()
+                send({"done": True, "seconds": time.perf_counter() - started})
+        except Exception as error:
+            send({"error": "{}: {}".format(type(error).__name__, error)})
+        finally:
+            await writer.drain()
+            writer.close()
+
+
+async def serve(handle, host=HOST, port=PORT, token_budget=TOKEN_BUDGET, max_wait=MAX_WAIT):
+    service = InferenceService(handle, token_budget=token_budget, max_wait=max_wait)
+    batches = asyncio.ensure_future(service.run_batches())
+    server = await asyncio.start_server(service.handle_client, host, port, limit=MAX_REQUEST_BYTES)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batches.cancel()
+
+
+class InferenceClient:
+    """Blocking client for the inference service, usable wherever a run_prediction model is."""
+
+    def __init__(self, host=HOST, port=PORT, timeout=None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    @classmethod
+    def from_address(cls, address):
+        host, _, port = address.rpartition(":")
+        return cls(host or HOST, int(port))
+
+    def _request(self, request):
+        with socket.create_connection((self.host, self.port), timeout=self.timeout) as connection:
+            connection.sendall((json.dumps(request) + "\n").encode())
+            with connection.makefile("r") as responses:
+                for line in responses:
+                    message = json.loads(line)
+                    if "error" in message:
+                        raise RuntimeError("inference service: " + message["error"])
+                    yield message
+
+    def model_version(self):
+        return next(self._request({"type": "info"}))["model_version"]
+
+    def iter_answers(self, questions, context):
+        """Yield (question index, answer) as the service streams them back, in completion order."""
+        for message in self._request({"questions": list(questions), "context": context}):
+            if message.get("done"):
+                return
+            yield message["index"], message["answer"]
+
+    def predict(self, questions, context):
+        """Same result as run_prediction: answers keyed "0", "1", ... in question order."""
+        answers = dict(self.iter_answers(questions, context))
+        return OrderedDict((str(index), answers[index]) for index in range(len(questions)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--model-path", default=MODEL_PATH)
+    parser.add_argument("--backend", default="pytorch", choices=BACKENDS)
+    parser.add_argument("--token-budget", type=int, default=TOKEN_BUDGET)
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT * 1000)
+    args = parser.parse_args()
+
+    handle = load_model(args.model_path, backend=args.backend)
+    asyncio.run(serve(handle, args.host, args.port, args.token_budget, args.max_wait_ms / 1000))
+
+
+if __name__ == "__main__":
+    main()
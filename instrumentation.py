@@ -0,0 +1,124 @@
+"""Timing spans around the stages of the contract analysis pipeline.
+
+Pipeline code wraps each stage in span(name, **labels) and fills in what it
+processed; nothing is recorded unless a Tracer is active:
+
+    tracer = Tracer()
+    with tracing(tracer):
+        contract_flags(text, digest, nlp, flagger)
+    print(tracer.json_lines())
+    print(prometheus_text(tracer.spans))
+"""
+import contextvars
+import json
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+
+# one timed stage: labels tell spans of a stage apart (e.g. the flag category),
+# counts are what it processed, error the exception type name if it raised
+Span = namedtuple("Span", ["name", "labels", "started", "seconds", "counts", "error"])
+
+METRICS_PREFIX = "contract_analysis"
+
+_active = contextvars.ContextVar("tracer", default=None)
+
+
+class Tracer:
+    """Collects the spans recorded while it is active, calling listener(span) as each one ends."""
+
+    def __init__(self, listener=None):
+        self.spans = []
+        self.listener = listener
+        self._lock = threading.Lock()
+
+    def record(self, span):
+        with self._lock:
+            self.spans.append(span)
+        if self.listener is not None:
+            self.listener(span)
+
+    def totals(self):
+        """{stage: {"calls", "seconds", "errors", count: sum, ...}}; nested stages are counted in their parents too."""
+        totals = OrderedDict()
+        for span in self.spans:
+            total = totals.setdefault(span.name, OrderedDict([("calls", 0), ("seconds", 0.0), ("errors", 0)]))
+            total["calls"] += 1
+            total["seconds"] += span.seconds
+            total["errors"] += span.error is not None
+            for key, value in span.counts.items():
+                total[key] = total.get(key, 0) + value
+        return totals
+
+    def json_lines(self):
+        return "".join(json.dumps(span._asdict()) + "\n" for span in self.spans)
+
+
+@contextmanager
+def tracing(tracer):
+    """Make tracer collect the spans recorded in this thread (and tasks started from it) until exit."""
+    token = _active.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _active.reset(token)
+
+
+@contextmanager
+def span(name, **labels):
+    """Time the block as one span of stage name; the block adds what it processed to the yielded counts dict."""
+    counts = {}
+    tracer = _active.get()
+    if tracer is None:
+        yield counts
+        return
+
+    started = time.time()
+    clock = time.perf_counter()
+    error = None
+    try:
+        yield counts
+    except BaseException as exception:
+        error = type(exception).__name__
+        raise
+    finally:
+        tracer.record(Span(name, labels, started, time.perf_counter() - clock, counts, error))
+
+
+def _labels(pairs):
+    return "{" + ",".join('{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                          for key, value in pairs) + "}"
+
+
+def prometheus_text(spans, prefix=METRICS_PREFIX):
+    """Spans aggregated per stage and labels in the Prometheus text exposition format."""
+    seconds = OrderedDict()
+    errors = OrderedDict()
+    items = OrderedDict()
+    for span in spans:
+        key = (("stage", span.name),) + tuple(sorted(span.labels.items()))
+        calls, total = seconds.get(key, (0, 0.0))
+        seconds[key] = (calls + 1, total + span.seconds)
+        errors[key] = errors.get(key, 0) + (span.error is not None)
+        for item, value in span.counts.items():
+            item_key = key + (("item", item),)
+            items[item_key] = items.get(item_key, 0) + value
+
+    lines = [
+        "# HELP {}_stage_seconds Wall time spent in each pipeline stage.".format(prefix),
+        "# TYPE {}_stage_seconds summary".format(prefix),
+    ]
+    for key, (calls, total) in seconds.items():
+        lines.append("{}_stage_seconds_sum{} {}".format(prefix, _labels(key), total))
+        lines.append("{}_stage_seconds_count{} {}".format(prefix, _labels(key), calls))
+    lines.append("# HELP {}_stage_errors_total Pipeline stage runs that raised.".format(prefix))
+    lines.append("# TYPE {}_stage_errors_total counter".format(prefix))
+    for key, count in errors.items():
+        lines.append("{}_stage_errors_total{} {}".format(prefix, _labels(key), count))
+    lines.append("# HELP {}_stage_items_total Items (pages, sentences, features, matches, ...) processed.".format(
+        prefix))
+    lines.append("# TYPE {}_stage_items_total counter".format(prefix))
+    for key, count in items.items():
+        lines.append("{}_stage_items_total{} {}".format(prefix, _labels(key), count))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,71 @@
+import hashlib
+import json
+import os
+from collections import namedtuple
+
+from spacy.tokens import DocBin
+
+from nlp_pipeline import pipeline_version
+
+LEXICON_PATH = "asc606_lexicon.json"
+CACHE_DIR = ".cache/lexicon"
+
+# a flag category with its phrases already compiled into pattern Docs
+Category = namedtuple("Category", ["id", "label", "patterns"])
+
+# compiled lexicons already loaded in this process, keyed by (vocab, version)
+_compiled = {}
+
+
+def load_lexicon(path=LEXICON_PATH):
+    with open(path) as json_file:
+        data = json.load(json_file)
+    return data["categories"]
+
+
+def lexicon_version(nlp, path=LEXICON_PATH):
+    """Digest of the lexicon file and the spaCy pipeline; any change recompiles the patterns."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as lexicon_file:
+        digest.update(lexicon_file.read())
+    digest.update(pipeline_version(nlp).encode())
+    return digest.hexdigest()[:16]
+
+
+def _compile(nlp, categories):
+    doc_bin = DocBin(attrs=["ORTH", "LEMMA"], store_user_data=True)
+    phrases = [phrase for category in categories for phrase in category["phrases"]]
+    owners = [category["id"] for category in categories for _ in category["phrases"]]
+    for owner, pattern in zip(owners, nlp.pipe(phrases)):
+        pattern.user_data["category"] = owner
+        doc_bin.add(pattern)
+    return doc_bin
+
+
+def load_compiled_lexicon(nlp, path=LEXICON_PATH, cache_dir=CACHE_DIR):
+    """Return (version, [Category, ...]) for path, compiling to a cached DocBin only when stale."""
+    version = lexicon_version(nlp, path)
+    key = (id(nlp.vocab), version)
+    if key in _compiled:
+        return version, _compiled[key]
+
+    categories = load_lexicon(path)
+    cache_path = os.path.join(cache_dir, version + ".spacy")
+    if os.path.exists(cache_path):
+        doc_bin = DocBin(store_user_data=True).from_disk(cache_path)
+    else:
+        doc_bin = _compile(nlp, categories)
+        os.makedirs(cache_dir, exist_ok=True)
+        # write then rename so concurrent workers never read a partial file
+        tmp_path = "{}.{}.tmp".format(cache_path, os.getpid())
+        doc_bin.to_disk(tmp_path)
+        os.replace(tmp_path, cache_path)
+
+    patterns = {category["id"]: [] for category in categories}
+    for pattern in doc_bin.get_docs(nlp.vocab):
+        patterns[pattern.user_data["category"]].append(pattern)
+
+    compiled = [Category(category["id"], category["label"], patterns[category["id"]])
+                for category in categories]
+    _compiled[key] = compiled
+    return version, compiled
@@ -0,0 +1,94 @@
+import hashlib
+import multiprocessing
+import re
+from functools import lru_cache
+
+import spacy
+from spacy.tokens import Doc
+
+from instrumentation import span
+
+MODEL_NAME = "en_core_web_sm"
+
+# which en_core_web_sm components each use case loads: "full" is the stock
+# pipeline, "flagging" only needs lemmas and sentence boundaries, so it swaps
+# the dependency parser for the much cheaper senter and drops NER
+PROFILES = {
+    "full": {"exclude": [], "enable": []},
+    "flagging": {"exclude": ["parser", "ner"], "enable": ["senter"]},
+}
+
+# characters per chunk handed to nlp.pipe; a few pages, far below nlp.max_length
+CHUNK_SIZE = 20000
+BATCH_SIZE = 8
+
+# page breaks from PDF extraction or blank lines between paragraphs
+_BREAK = re.compile(r"\f|\n[ \t]*\n")
+
+
+@lru_cache(maxsize=None)
+def load_nlp(profile="flagging", name=MODEL_NAME):
+    """Load (once per process) the spaCy pipeline configured for profile."""
+    settings = PROFILES[profile]
+    nlp = spacy.load(name, exclude=settings["exclude"])
+    for component in settings["enable"]:
+        nlp.enable_pipe(component)
+    return nlp
+
+
+def pipeline_version(nlp):
+    """Digest of the spaCy version, model and enabled components: everything that changes a parsed Doc."""
+    digest = hashlib.sha256()
+    digest.update(spacy.__version__.encode())
+    digest.update("{lang}_{name}-{version}".format(**nlp.meta).encode())
+    digest.update(",".join(nlp.pipe_names).encode())
+    return digest.hexdigest()[:16]
+
+
+def split_text(text, chunk_size=CHUNK_SIZE):
+    """Yield (offset, chunk) pieces of text that concatenate back to text exactly.
+
+    Chunks end on the last page or paragraph break that fits, falling back to
+    the last whitespace and finally to a hard cut at chunk_size.
+    """
+    start = 0
+    while start < len(text):
+        end = start + chunk_size
+        if end >= len(text):
+            yield start, text[start:]
+            return
+
+        cut = start
+        for match in _BREAK.finditer(text, start, end):
+            cut = match.end()
+        if cut == start:
+            cut = max(text.rfind(" ", start, end), text.rfind("\n", start, end)) + 1
+        if cut <= start:
+            cut = end
+
+        yield start, text[start:cut]
+        start = cut
+
+
+def parse_contract(nlp, text, n_process=1, batch_size=BATCH_SIZE, chunk_size=CHUNK_SIZE):
+    """Parse text in chunks with nlp.pipe and join them into one Doc aligned with text.
+
+    Tokenization is non-destructive and the chunks are joined without adding
+    whitespace, so character offsets on the returned Doc (sent.start_char,
+    span.end_char, ...) index straight into the original text.
+    """
+    chunks = [chunk for _, chunk in split_text(text, chunk_size)]
+    if not chunks:
+        return nlp.make_doc(text)
+
+    if n_process == -1:
+        n_process = multiprocessing.cpu_count()
+    n_process = max(1, min(n_process, len(chunks)))
+
+    with span("parse") as counts:
+        docs = list(nlp.pipe(chunks, n_process=n_process, batch_size=batch_size))
+        doc = docs[0] if len(docs) == 1 else Doc.from_docs(docs, ensure_whitespace=False)
+        counts["chunks"] = len(chunks)
+        counts["tokens"] = len(doc)
+        counts["sentences"] = sum(1 for _ in doc.sents)
+    return doc
@@ -1,5 +1,11 @@
+import hashlib
+import multiprocessing
+import os
+import threading
+from collections import namedtuple
+
 import torch
-from torch.utils.data import DataLoader, SequentialSampler
+from torch.utils.data import TensorDataset
 
 from transformers import (
     AutoConfig,
@@ -8,102 +14,230 @@ from transformers import (
     squad_convert_examples_to_features
 )
 
-from transformers.data.processors.squad import SquadResult, SquadV2Processor, SquadExample
-from transformers.data.metrics.squad_metrics import compute_predictions_logits
+from transformers.data.processors.squad import SquadExample
+
+from instrumentation import span
+from qa_backends import build_backend
+from qa_decode import decode_predictions
+from qa_features import convert_questions_to_features, select_features, supports_shared_context
+from qa_inference import TOKEN_BUDGET, null_dominant, run_inference
+
+MODEL_PATH = "cuad-training/cuad-models/"
+
+# windowing and decoding settings the CUAD model is run with
+MAX_SEQ_LENGTH = 512
+DOC_STRIDE = 256
+MAX_QUERY_LENGTH = 64
+MAX_ANSWER_LENGTH = 512
+NULL_SCORE_DIFF_THRESHOLD = 0.0
 
-def run_prediction(question_texts, context_text, model_path):
-    max_seq_length = 512
-    doc_stride = 256
-    n_best_size = 1
-    max_query_length = 64
-    max_answer_length = 512
+# a loaded CUAD model together with everything run_prediction needs to use it
+# model is the inference backend: model(input_ids, attention_mask, token_type_ids) -> (start, end) logits
+ModelHandle = namedtuple("ModelHandle", ["model_path", "device", "config", "tokenizer", "model", "backend"])
+
+# process-wide registry of loaded models keyed by (absolute model path, device, backend)
+_model_registry = {}
+_registry_lock = threading.Lock()
+
+
+def get_device(device=None):
+    if device is None:
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+    return torch.device(device)
+
+
+def _warmup(handle):
+    # one tiny forward pass so the first contract does not pay for lazy init
+    inputs = handle.tokenizer("warm up", "warm up", return_tensors="pt")
+    inputs = {name: tensor.to(handle.device) for name, tensor in inputs.items()}
+    with torch.no_grad():
+        handle.model(**inputs)
+
+
+def load_model(model_path=MODEL_PATH, device=None, warmup=True, backend="pytorch"):
+    """Return the resident handle for model_path on device, loading it on first use.
+
+    backend is one of qa_backends.BACKENDS: "pytorch" (fp32 eager), "quantized"
+    (dynamic int8 Linear layers, CPU only) or "onnx" (ONNX Runtime over an
+    export cached in <model_path>/onnx/).
+    """
+    device = get_device(device)
+    key = (os.path.abspath(model_path), str(device), backend)
+
+    with _registry_lock:
+        handle = _model_registry.get(key)
+        if handle is None:
+            config = AutoConfig.from_pretrained(model_path)
+            tokenizer = AutoTokenizer.from_pretrained(
+                model_path, do_lower_case=True, use_fast=False)
+
+            def load_torch_model():
+                model = AutoModelForQuestionAnswering.from_pretrained(model_path, config=config)
+                model.to(device)
+                model.eval()
+                return model
+
+            model = build_backend(backend, load_torch_model, model_path, device)
+            handle = ModelHandle(model_path, device, config, tokenizer, model, backend)
+            if warmup:
+                _warmup(handle)
+            _model_registry[key] = handle
+
+    return handle
+
+
+def model_version(handle):
+    """Fingerprint of the weights, config and backend behind a handle, for keying cached answers."""
+    digest = hashlib.sha256(handle.backend.encode())
+    digest.update(handle.config.to_json_string().encode())
+    weights_path = os.path.join(handle.model_path, "pytorch_model.bin")
+    if os.path.exists(weights_path):
+        stat = os.stat(weights_path)
+        digest.update("{}:{}".format(stat.st_size, stat.st_mtime).encode())
+    return digest.hexdigest()[:16]
+
+
+def recorded_screen_margin(handle):
+    """The screening margin benchmarked for a screening model and saved in its config (qa_variants.py --record-margin).
+
+    A window the screening model gives a null score this far above any span
+    is not scored again. A variant nobody has measured has no margin and is
+    refused rather than screened with a guess.
+    """
+    margin = getattr(handle.config, "screen_margin", None)
+    if margin is None:
+        raise ValueError(
+            "{} has no recorded screening margin: run benchmarks/bench_all_questions.py with it as --light-model, "
+            "then save a margin with qa_variants.py --record-margin".format(handle.model_path))
+    return margin
+
+
+def conversion_workers(n_examples, threads=None):
+    # squad_convert_examples_to_features parallelizes across examples (one per
+    # question), so more workers than questions only adds pool start-up cost
+    if threads is None:
+        threads = multiprocessing.cpu_count()
+    return max(1, min(threads, n_examples))
+
+
+def _select_rows(features, dataset, rows):
+    index = torch.tensor(rows, dtype=torch.long)
+    return [features[row] for row in rows], TensorDataset(*(tensor[index] for tensor in dataset.tensors))
+
+
+def run_prediction(question_texts, context_text, model=MODEL_PATH, threads=None, shared_context=True,
+                   token_budget=TOKEN_BUDGET, prefilter=None, screen=None, screen_margin=None,
+                   with_null_odds=False):
+    """Answers keyed "0", "1", ... for each question over context_text, "" where there is none.
+
+    prefilter (a retrieval.RelevancePrefilter) limits each question to the
+    windows near its most relevant passages. screen, a cheaper handle with the
+    same tokenizer (e.g. a qa_variants layer-dropped model), scores every
+    window first; windows it finds null-dominant by more than screen_margin
+    (by default the margin recorded for screen) are skipped by model.
+    with_null_odds also returns the null odds.
+
+    threads sizes the per-question conversion pool of the shared_context=False
+    fallback only. The shared-context path tokenizes the contract once in this
+    process and ignores it; with the CUAD RoBERTa tokenizer that path is always
+    taken.
+    """
+    max_seq_length = MAX_SEQ_LENGTH
+    doc_stride = DOC_STRIDE
+    max_query_length = MAX_QUERY_LENGTH
+    max_answer_length = MAX_ANSWER_LENGTH
     do_lower_case = False
-    null_score_diff_threshold = 0.0
-
-    def to_list(tensor):
-        return tensor.detach().cpu().tolist()
-
-    config_class, model_class, tokenizer_class = (
-        AutoConfig, AutoModelForQuestionAnswering, AutoTokenizer)
-    config = config_class.from_pretrained(model_path)
-    tokenizer = tokenizer_class.from_pretrained(
-        model_path, do_lower_case=True, use_fast=False)
-    model = model_class.from_pretrained(model_path, config=config)
-
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    model.to(device)
-
-    processor = SquadV2Processor()
-    examples = []
-
-    for i, question_text in enumerate(question_texts):
-        example = SquadExample(
-            qas_id=str(i),
-            question_text=question_text,
-            context_text=context_text,
-            answer_text=None,
-            start_position_character=None,
-            title="Predict",
-            answers=None,
+    null_score_diff_threshold = NULL_SCORE_DIFF_THRESHOLD
+
+    # accept either a preloaded ModelHandle or a model path
+    if not isinstance(model, ModelHandle):
+        model = load_model(model)
+    tokenizer = model.tokenizer
+    device = model.device
+
+    with span("features") as counts:
+        if shared_context and supports_shared_context(tokenizer):
+            # tokenize and window the contract once, then prepend each question
+            examples, features, dataset = convert_questions_to_features(
+                question_texts,
+                context_text,
+                tokenizer,
+                max_seq_length=max_seq_length,
+                doc_stride=doc_stride,
+                max_query_length=max_query_length,
+            )
+        else:
+            examples = []
+
+            for i, question_text in enumerate(question_texts):
+                example = SquadExample(
+                    qas_id=str(i),
+                    question_text=question_text,
+                    context_text=context_text,
+                    answer_text=None,
+                    start_position_character=None,
+                    title="Predict",
+                    answers=None,
+                )
+
+                examples.append(example)
+
+            features, dataset = squad_convert_examples_to_features(
+                examples=examples,
+                tokenizer=tokenizer,
+                max_seq_length=max_seq_length,
+                doc_stride=doc_stride,
+                max_query_length=max_query_length,
+                is_training=False,
+                return_dataset="pt",
+                threads=conversion_workers(len(examples), threads),
+                tqdm_enabled=False,
+            )
+        counts["questions"] = len(question_texts)
+        counts["features"] = len(features)
+
+    if prefilter is not None:
+        # only score the windows overlapping the passages retrieved for each question
+        with span("prefilter") as counts:
+            rows = select_features(examples, features, [prefilter.regions(question) for question in question_texts])
+            counts["features"] = len(rows)
+            counts["skipped_features"] = len(features) - len(rows)
+        features, dataset = _select_rows(features, dataset, rows)
+
+    if screen is not None and screen_margin is None:
+        screen_margin = recorded_screen_margin(screen)
+
+    if screen is not None and len(features):
+        # early exit: windows the cheap model is sure hold no answer never reach the full model
+        with span("screen") as counts:
+            start_logits, end_logits = run_inference(
+                screen, dataset, max_seq_length=max_seq_length, token_budget=token_budget)
+            skip = null_dominant(start_logits, end_logits, dataset.tensors[5], dataset.tensors[4], screen_margin)
+            rows = (~skip).nonzero().flatten().tolist()
+            counts["features"] = len(rows)
+            counts["skipped_features"] = len(features) - len(rows)
+        features, dataset = _select_rows(features, dataset, rows)
+
+    # length-bucketed batches trimmed to their longest window, sized by token budget
+    with span("inference") as counts:
+        all_start_logits, all_end_logits = run_inference(
+            model, dataset, max_seq_length=max_seq_length, token_budget=token_budget)
+        counts["features"] = len(features)
+
+    with span("decode") as counts:
+        final_predictions, null_odds = decode_predictions(
+            examples,
+            features,
+            all_start_logits,
+            all_end_logits,
+            tokenizer,
+            max_answer_length=max_answer_length,
+            do_lower_case=do_lower_case,
+            null_score_diff_threshold=null_score_diff_threshold,
         )
+        counts["questions"] = len(question_texts)
+        counts["answers"] = sum(1 for answer in final_predictions.values() if answer)
 
-        examples.append(example)
-
-    features, dataset = squad_convert_examples_to_features(
-        examples=examples,
-        tokenizer=tokenizer,
-        max_seq_length=max_seq_length,
-        doc_stride=doc_stride,
-        max_query_length=max_query_length,
-        is_training=False,
-        return_dataset="pt",
-        threads=1,
-    )
-
-    eval_sampler = SequentialSampler(dataset)
-    eval_dataloader = DataLoader(dataset, sampler=eval_sampler, batch_size=10)
-
-    all_results = []
-
-    for batch in eval_dataloader:
-        model.eval()
-        batch = tuple(t.to(device) for t in batch)
-
-        with torch.no_grad():
-            inputs = {
-                "input_ids": batch[0],
-                "attention_mask": batch[1],
-                "token_type_ids": batch[2],
-            }
-
-            example_indices = batch[3]
-
-            outputs = model(**inputs)
-
-            for i, example_index in enumerate(example_indices):
-                eval_feature = features[example_index.item()]
-                unique_id = int(eval_feature.unique_id)
-
-                output = [to_list(output[i]) for output in outputs.to_tuple()]
-
-                start_logits, end_logits = output
-                result = SquadResult(unique_id, start_logits, end_logits)
-                all_results.append(result)
-
-    final_predictions = compute_predictions_logits(
-        all_examples=examples,
-        all_features=features,
-        all_results=all_results,
-        n_best_size=n_best_size,
-        max_answer_length=max_answer_length,
-        do_lower_case=do_lower_case,
-        output_prediction_file=None,
-        output_nbest_file=None,
-        output_null_log_odds_file=None,
-        verbose_logging=False,
-        version_2_with_negative=True,
-        null_score_diff_threshold=null_score_diff_threshold,
-        tokenizer=tokenizer
-    )
-
-    return final_predictions
\ No newline at end of file
+    if with_null_odds:
+        return final_predictions, null_odds
+    return final_predictions
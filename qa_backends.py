@@ -0,0 +1,108 @@
+import os
+
+import torch
+
+BACKENDS = ("pytorch", "quantized", "onnx")
+
+ONNX_DIR = "onnx"
+ONNX_OPSET = 12
+
+
+class TorchBackend:
+    """Eager PyTorch forward pass returning (start_logits, end_logits)."""
+
+    def __init__(self, model):
+        self.model = model
+
+    def __call__(self, input_ids, attention_mask, token_type_ids=None):
+        outputs = self.model(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids)
+        return outputs.to_tuple()[:2]
+
+
+class _LogitsOnly(torch.nn.Module):
+    # tuple outputs with a fixed argument order, which is what torch.onnx.export traces
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask, token_type_ids):
+        outputs = self.model(input_ids=input_ids, attention_mask=attention_mask,
+                             token_type_ids=token_type_ids, return_dict=False)
+        return outputs[0], outputs[1]
+
+
+def onnx_export_path(model_path):
+    return os.path.join(model_path, ONNX_DIR, "model.onnx")
+
+
+def onnx_export_is_current(model_path):
+    # rebuilt whenever the weights are newer than the cached export
+    onnx_path = onnx_export_path(model_path)
+    weights_path = os.path.join(model_path, "pytorch_model.bin")
+    return os.path.exists(onnx_path) and os.path.getmtime(onnx_path) >= os.path.getmtime(weights_path)
+
+
+def export_onnx(model, model_path):
+    """Export model to <model_path>/onnx/model.onnx with dynamic batch and sequence axes."""
+    onnx_path = onnx_export_path(model_path)
+    os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
+    # ordinary (non-pad) token ids and batch/sequence sizes above 1, so no shape or padding path gets specialized
+    dummy = torch.arange(100, 132, dtype=torch.long).view(2, 16)
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in
+                    ("input_ids", "attention_mask", "token_type_ids", "start_logits", "end_logits")}
+    # export to a private file first so concurrent processes never load a partial model
+    tmp_path = "{}.{}.tmp".format(onnx_path, os.getpid())
+    torch.onnx.export(
+        _LogitsOnly(model).cpu().eval(),
+        (dummy, torch.ones_like(dummy), torch.zeros_like(dummy)),
+        tmp_path,
+        input_names=["input_ids", "attention_mask", "token_type_ids"],
+        output_names=["start_logits", "end_logits"],
+        dynamic_axes=dynamic_axes,
+        opset_version=ONNX_OPSET,
+    )
+    os.replace(tmp_path, onnx_path)
+    return onnx_path
+
+
+class OnnxBackend:
+    """ONNX Runtime session over the cached export, same call signature as TorchBackend."""
+
+    def __init__(self, onnx_path, device):
+        import onnxruntime
+
+        providers = ["CPUExecutionProvider"]
+        if device.type == "cuda":
+            providers.insert(0, "CUDAExecutionProvider")
+        self.session = onnxruntime.InferenceSession(onnx_path, providers=providers)
+
+    def __call__(self, input_ids, attention_mask, token_type_ids=None):
+        if token_type_ids is None:
+            token_type_ids = torch.zeros_like(input_ids)
+        start_logits, end_logits = self.session.run(None, {
+            "input_ids": input_ids.cpu().numpy(),
+            "attention_mask": attention_mask.cpu().numpy(),
+            "token_type_ids": token_type_ids.cpu().numpy(),
+        })
+        return torch.from_numpy(start_logits), torch.from_numpy(end_logits)
+
+
+def build_backend(name, load_torch_model, model_path, device):
+    """Return the named inference backend; load_torch_model() gives the fp32 model on device."""
+    if name == "pytorch":
+        return TorchBackend(load_torch_model())
+
+    if name == "quantized":
+        if device.type != "cpu":
+            raise ValueError("the quantized backend only runs on CPU, got device {}".format(device))
+        # int8 weights, activations quantized on the fly: the Linear layers dominate RoBERTa on CPU
+        quantized = torch.quantization.quantize_dynamic(load_torch_model(), {torch.nn.Linear}, dtype=torch.qint8)
+        return TorchBackend(quantized)
+
+    if name == "onnx":
+        # the fp32 weights are only needed when the cached export is missing or stale
+        if not onnx_export_is_current(model_path):
+            export_onnx(load_torch_model(), model_path)
+        return OnnxBackend(onnx_export_path(model_path), device)
+
+    raise ValueError("unknown backend {!r}, expected one of {}".format(name, ", ".join(BACKENDS)))
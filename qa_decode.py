@@ -0,0 +1,107 @@
+from collections import OrderedDict, defaultdict
+
+import torch
+
+from transformers.data.metrics.squad_metrics import get_final_text
+
+
+def _answer_text(example, feature, start_index, end_index, tokenizer, do_lower_case):
+    # same text recovery as compute_predictions_logits
+    tok_tokens = feature.tokens[start_index:(end_index + 1)]
+    orig_doc_start = feature.token_to_orig_map[start_index]
+    orig_doc_end = feature.token_to_orig_map[end_index]
+    orig_tokens = example.doc_tokens[orig_doc_start:(orig_doc_end + 1)]
+
+    tok_text = tokenizer.convert_tokens_to_string(tok_tokens)
+    tok_text = tok_text.strip()
+    tok_text = " ".join(tok_text.split())
+    orig_text = " ".join(orig_tokens)
+
+    return get_final_text(tok_text, orig_text, do_lower_case, False)
+
+
+def decode_predictions(examples, features, start_logits, end_logits, tokenizer, max_answer_length,
+                       do_lower_case=False, null_score_diff_threshold=0.0, example_indices=None):
+    """Best-span decoding straight from (n_features, seq_len) logit tensors.
+
+    Equivalent to compute_predictions_logits(n_best_size=1,
+    version_2_with_negative=True): each window proposes its arg-max start and
+    arg-max end, invalid pairs are dropped, windows of the same example are
+    merged and the null score threshold is applied. Only a handful of scalars
+    per window leave the tensors. Returns (predictions, null_odds) keyed by
+    qas_id. With example_indices only those examples are decoded, and features
+    (with their logit rows) may be limited to the windows of those examples.
+    """
+    n_features = len(features)
+    start_indexes = start_logits.argmax(dim=1)
+    end_indexes = end_logits.argmax(dim=1)
+
+    # Python adds the logits as doubles; do the same so ties and thresholds agree
+    rows = torch.arange(n_features)
+    start_scores = start_logits[rows, start_indexes].double()
+    end_scores = end_logits[rows, end_indexes].double()
+    span_scores = start_scores + end_scores
+    null_scores = start_logits[:, 0].double() + end_logits[:, 0].double()
+
+    # a span is only valid inside the window's context tokens, in order, and short enough
+    n_tokens = torch.tensor([len(feature.tokens) for feature in features], dtype=torch.long)
+    context_start = torch.tensor([min(feature.token_to_orig_map, default=0) for feature in features],
+                                 dtype=torch.long)
+    context_end = context_start + torch.tensor([len(feature.token_to_orig_map) for feature in features],
+                                               dtype=torch.long)
+    valid = (
+        (start_indexes < n_tokens) & (end_indexes < n_tokens)
+        & (start_indexes >= context_start) & (start_indexes < context_end)
+        & (end_indexes >= context_start) & (end_indexes < context_end)
+        & (end_indexes >= start_indexes)
+        & (end_indexes - start_indexes + 1 <= max_answer_length)
+    )
+
+    start_indexes = start_indexes.tolist()
+    end_indexes = end_indexes.tolist()
+    start_scores = start_scores.tolist()
+    end_scores = end_scores.tolist()
+    span_scores = span_scores.tolist()
+    null_scores = null_scores.tolist()
+    valid = valid.tolist()
+
+    example_index_to_features = defaultdict(list)
+    for feature_index, feature in enumerate(features):
+        example_index_to_features[feature.example_index].append(feature_index)
+
+    predictions = OrderedDict()
+    null_odds = OrderedDict()
+
+    for example_index, example in enumerate(examples):
+        if example_indices is not None and example_index not in example_indices:
+            continue
+        score_null = 1000000
+        best = None
+        for feature_index in example_index_to_features[example_index]:
+            score_null = min(score_null, null_scores[feature_index])
+            feature = features[feature_index]
+            if not valid[feature_index]:
+                continue
+            if not feature.token_is_max_context.get(start_indexes[feature_index], False):
+                continue
+            # ties go to the earliest window, as with the stable sort upstream
+            if best is None or span_scores[feature_index] > span_scores[best]:
+                best = feature_index
+
+        text = ""
+        if best is not None and span_scores[best] >= score_null:
+            text = _answer_text(example, features[best], start_indexes[best], end_indexes[best],
+                                tokenizer, do_lower_case)
+
+        if text:
+            score_diff = score_null - start_scores[best] - end_scores[best]
+            answer = "" if score_diff > null_score_diff_threshold else text
+        else:
+            # the null answer ranked first: upstream compares it against a 0.0-scored "empty" entry
+            score_diff = score_null
+            answer = "" if score_diff > null_score_diff_threshold else "empty"
+
+        predictions[example.qas_id] = answer
+        null_odds[example.qas_id] = score_diff
+
+    return predictions, null_odds
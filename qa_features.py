@@ -0,0 +1,231 @@
+import copy
+from collections import namedtuple
+
+import numpy as np
+import torch
+from torch.utils.data import TensorDataset
+
+from transformers.data.processors.squad import MULTI_SEP_TOKENS_TOKENIZERS_SET, SquadExample, SquadFeatures
+
+# tokenizers whose sub-tokens depend on a leading space (mirrors squad_convert_example_to_features)
+_PREFIX_SPACE_TOKENIZERS = {
+    "RobertaTokenizer",
+    "LongformerTokenizer",
+    "BartTokenizer",
+    "RobertaTokenizerFast",
+    "LongformerTokenizerFast",
+    "BartTokenizerFast",
+}
+
+# the contract split into words and sub-tokens once, shared by every question
+ContextTokens = namedtuple("ContextTokens", ["example", "sub_token_ids", "tok_to_orig_index"])
+
+
+def supports_shared_context(tokenizer):
+    # question first, context second: the layout the shared windows are cut for
+    return tokenizer.padding_side == "right"
+
+
+def tokenize_context(context_text, tokenizer):
+    """Split and sub-tokenize context_text once, exactly as squad_convert_example_to_features does."""
+    example = SquadExample(
+        qas_id=None,
+        question_text=None,
+        context_text=context_text,
+        answer_text=None,
+        start_position_character=None,
+        title="Predict",
+        answers=None,
+    )
+
+    add_prefix_space = tokenizer.__class__.__name__ in _PREFIX_SPACE_TOKENIZERS
+    # contracts repeat the same words constantly, and sub-tokens only depend on the word
+    word_ids = {}
+    sub_token_ids = []
+    tok_to_orig_index = []
+    for i, token in enumerate(example.doc_tokens):
+        ids = word_ids.get(token)
+        if ids is None:
+            if add_prefix_space:
+                sub_tokens = tokenizer.tokenize(token, add_prefix_space=True)
+            else:
+                sub_tokens = tokenizer.tokenize(token)
+            ids = word_ids[token] = tokenizer.convert_tokens_to_ids(sub_tokens)
+        sub_token_ids.extend(ids)
+        tok_to_orig_index.extend([i] * len(ids))
+
+    return ContextTokens(example, sub_token_ids, tok_to_orig_index)
+
+
+def _doc_spans(n_tokens, doc_stride, capacity):
+    # (start, length) of each window; identical to the overflow loop in squad_convert_example_to_features
+    spans = []
+    while len(spans) * doc_stride < n_tokens:
+        start = len(spans) * doc_stride
+        spans.append((start, min(n_tokens - start, capacity)))
+        if n_tokens - start <= capacity:
+            break
+    return spans
+
+
+def _max_context_span(spans, doc_stride, capacity, position):
+    # same scoring as _new_check_is_max_context, but only over the few spans that can contain position
+    best_score = None
+    best_span_index = None
+    first = max(0, (position - capacity) // doc_stride)
+    last = min(len(spans) - 1, position // doc_stride)
+    for span_index in range(first, last + 1):
+        start, length = spans[span_index]
+        end = start + length - 1
+        if position < start or position > end:
+            continue
+        score = min(position - start, end - position) + 0.01 * length
+        if best_score is None or score > best_score:
+            best_score = score
+            best_span_index = span_index
+    return best_span_index
+
+
+def question_features(question_text, qas_id, context, tokenizer, max_seq_length, doc_stride, max_query_length):
+    """Build the SquadFeatures for one question by prepending it to the shared context windows."""
+    truncated_query = tokenizer.encode(
+        question_text, add_special_tokens=False, truncation=True, max_length=max_query_length
+    )
+
+    tokenizer_type = type(tokenizer).__name__.replace("Tokenizer", "").lower()
+    sequence_added_tokens = (
+        tokenizer.model_max_length - tokenizer.max_len_single_sentence + 1
+        if tokenizer_type in MULTI_SEP_TOKENS_TOKENIZERS_SET
+        else tokenizer.model_max_length - tokenizer.max_len_single_sentence
+    )
+    sequence_pair_added_tokens = tokenizer.model_max_length - tokenizer.max_len_sentences_pair
+    capacity = max_seq_length - len(truncated_query) - sequence_pair_added_tokens
+    doc_offset = len(truncated_query) + sequence_added_tokens
+
+    spans = _doc_spans(len(context.sub_token_ids), doc_stride, capacity)
+
+    features = []
+    for span_index, (start, length) in enumerate(spans):
+        span_ids = context.sub_token_ids[start:start + length]
+        input_ids = tokenizer.build_inputs_with_special_tokens(truncated_query, span_ids)
+        token_type_ids = tokenizer.create_token_type_ids_from_sequences(truncated_query, span_ids)
+        attention_mask = [1] * len(input_ids)
+        tokens = tokenizer.convert_ids_to_tokens(input_ids)
+
+        difference = max_seq_length - len(input_ids)
+        input_ids = input_ids + [tokenizer.pad_token_id] * difference
+        token_type_ids = token_type_ids + [tokenizer.pad_token_type_id] * difference
+        attention_mask = attention_mask + [0] * difference
+
+        token_to_orig_map = {}
+        token_is_max_context = {}
+        for i in range(length):
+            token_to_orig_map[doc_offset + i] = context.tok_to_orig_index[start + i]
+            token_is_max_context[doc_offset + i] = (
+                _max_context_span(spans, doc_stride, capacity, start + i) == span_index
+            )
+
+        cls_index = input_ids.index(tokenizer.cls_token_id)
+        p_mask = np.ones_like(token_type_ids)
+        p_mask[doc_offset:] = 0
+        special_token_indices = np.asarray(
+            tokenizer.get_special_tokens_mask(input_ids, already_has_special_tokens=True)
+        ).nonzero()
+        p_mask[special_token_indices] = 1
+        p_mask[cls_index] = 0
+
+        features.append(
+            SquadFeatures(
+                input_ids,
+                attention_mask,
+                token_type_ids,
+                cls_index,
+                p_mask.tolist(),
+                example_index=0,
+                unique_id=0,
+                paragraph_len=length,
+                token_is_max_context=token_is_max_context,
+                tokens=tokens,
+                token_to_orig_map=token_to_orig_map,
+                start_position=0,
+                end_position=0,
+                is_impossible=False,
+                qas_id=qas_id,
+            )
+        )
+    return features
+
+
+def convert_questions_to_features(question_texts, context_text, tokenizer, max_seq_length, doc_stride,
+                                  max_query_length):
+    """Shared-context replacement for squad_convert_examples_to_features(is_training=False, return_dataset="pt").
+
+    The context is tokenized and windowed once; each question only costs its
+    own encoding plus assembling its windows. Returns (examples, features,
+    dataset) matching the per-example conversion exactly.
+    """
+    context = tokenize_context(context_text, tokenizer)
+
+    examples = []
+    features = []
+    unique_id = 1000000000
+    example_index = 0
+    for i, question_text in enumerate(question_texts):
+        example = copy.copy(context.example)
+        example.qas_id = str(i)
+        example.question_text = question_text
+        examples.append(example)
+
+        example_features = question_features(
+            question_text, example.qas_id, context, tokenizer, max_seq_length, doc_stride, max_query_length)
+        if not example_features:
+            continue
+        for feature in example_features:
+            feature.example_index = example_index
+            feature.unique_id = unique_id
+            features.append(feature)
+            unique_id += 1
+        example_index += 1
+
+    all_input_ids = torch.tensor([f.input_ids for f in features], dtype=torch.long)
+    all_attention_masks = torch.tensor([f.attention_mask for f in features], dtype=torch.long)
+    all_token_type_ids = torch.tensor([f.token_type_ids for f in features], dtype=torch.long)
+    all_feature_index = torch.arange(all_input_ids.size(0), dtype=torch.long)
+    all_cls_index = torch.tensor([f.cls_index for f in features], dtype=torch.long)
+    all_p_mask = torch.tensor([f.p_mask for f in features], dtype=torch.float)
+    dataset = TensorDataset(
+        all_input_ids, all_attention_masks, all_token_type_ids, all_feature_index, all_cls_index, all_p_mask
+    )
+
+    return examples, features, dataset
+
+
+def select_features(examples, features, regions):
+    """Indices of the features whose window overlaps one of its question's regions.
+
+    regions[example_index] is a list of (start_char, end_char) spans of the
+    context, or None to keep every window of that question. A token inside a
+    region keeps every window containing it, so its max-context window is
+    never dropped.
+    """
+    word_ranges = {}
+    for example_index, example_regions in enumerate(regions):
+        if example_regions is None:
+            continue
+        offsets = examples[example_index].char_to_word_offset
+        word_ranges[example_index] = [
+            (offsets[start], offsets[min(end, len(offsets)) - 1])
+            for start, end in example_regions if start < min(end, len(offsets))
+        ]
+
+    kept = []
+    for row, feature in enumerate(features):
+        ranges = word_ranges.get(feature.example_index)
+        if ranges is None:
+            kept.append(row)
+            continue
+        words = feature.token_to_orig_map.values()
+        first, last = min(words), max(words)
+        if any(start <= last and first <= end for start, end in ranges):
+            kept.append(row)
+    return kept
@@ -0,0 +1,99 @@
+import torch
+
+from instrumentation import span
+
+# batches are sized so that batch_size * padded_length stays under this many tokens;
+# the old fixed DataLoader(batch_size=10) over 512-token windows is 5120
+TOKEN_BUDGET = 5120
+
+# models that give every pad token the same position id (padding_idx), so every
+# pad position of a window ends up with the same start/end logit
+_SHARED_PAD_POSITION_MODELS = {"roberta", "xlm-roberta", "camembert", "longformer"}
+
+
+def bucketed_batches(lengths, max_seq_length, token_budget=TOKEN_BUDGET, keep_pad_column=True):
+    """Group feature indices into batches of similar real length.
+
+    Yields (indices, width): features are taken longest first, each batch is
+    trimmed to width columns and holds as many features as fit in token_budget.
+    With keep_pad_column every batch keeps at least one padding column whenever
+    a feature is shorter than max_seq_length, so its padding logit is known.
+    """
+    order = sorted(range(len(lengths)), key=lambda index: lengths[index], reverse=True)
+
+    start = 0
+    while start < len(order):
+        longest = lengths[order[start]]
+        width = min(longest + 1, max_seq_length) if keep_pad_column else longest
+        batch_size = max(1, token_budget // width)
+        yield order[start:start + batch_size], width
+        start += batch_size
+
+
+def _restore_padding(logits, lengths, max_seq_length):
+    # logits: (batch, width); fill columns width..max_seq_length with each row's padding logit
+    batch, width = logits.shape
+    if width == max_seq_length:
+        return logits
+    pad_logits = logits.gather(1, lengths.unsqueeze(1))
+    return torch.cat([logits, pad_logits.expand(batch, max_seq_length - width)], dim=1)
+
+
+def run_inference(handle, dataset, max_seq_length, token_budget=TOKEN_BUDGET):
+    """Run the QA model over a squad TensorDataset with length-bucketed, padding-trimmed batches.
+
+    Returns (start_logits, end_logits) as (n_features, max_seq_length) CPU tensors in
+    feature order, equal to what full-width batches would produce: trimmed
+    padding columns are restored from the batch's kept padding column, which
+    is valid because every pad position shares one position id.
+    """
+    input_ids, attention_mask, token_type_ids = dataset.tensors[:3]
+    n_features = input_ids.size(0)
+    if n_features == 0:
+        return torch.empty(0, max_seq_length), torch.empty(0, max_seq_length)
+    lengths = attention_mask.sum(dim=1)
+
+    trim = handle.config.model_type in _SHARED_PAD_POSITION_MODELS
+    if not trim:
+        lengths_for_batching = [max_seq_length] * n_features
+    else:
+        lengths_for_batching = lengths.tolist()
+
+    all_start_logits = torch.empty(n_features, max_seq_length)
+    all_end_logits = torch.empty(n_features, max_seq_length)
+
+    for indices, width in bucketed_batches(lengths_for_batching, max_seq_length, token_budget):
+        index = torch.tensor(indices, dtype=torch.long)
+        inputs = {
+            "input_ids": input_ids[index, :width].to(handle.device),
+            "attention_mask": attention_mask[index, :width].to(handle.device),
+            "token_type_ids": token_type_ids[index, :width].to(handle.device),
+        }
+
+        with span("inference_batch") as counts, torch.no_grad():
+            start_logits, end_logits = handle.model(**inputs)
+
+            batch_lengths = lengths[index]
+            all_start_logits[index] = _restore_padding(start_logits.float().cpu(), batch_lengths, max_seq_length)
+            all_end_logits[index] = _restore_padding(end_logits.float().cpu(), batch_lengths, max_seq_length)
+            counts["features"] = len(indices)
+            counts["tokens"] = int(batch_lengths.sum())
+            counts["padded_tokens"] = len(indices) * width
+
+    return all_start_logits, all_end_logits
+
+
+def null_dominant(start_logits, end_logits, p_mask, cls_index, margin):
+    """Windows whose null score beats every possible answer span by more than margin.
+
+    The best span score is bounded by the best start plus the best end over
+    the window's context tokens, so a window is only reported when no valid
+    span, whatever its length or order, could come close.
+    """
+    positions = torch.arange(p_mask.size(1)).unsqueeze(0)
+    context = (p_mask == 0) & (positions != cls_index.unsqueeze(1))
+    rows = torch.arange(p_mask.size(0))
+    null_scores = start_logits[rows, cls_index] + end_logits[rows, cls_index]
+    best_start = start_logits.masked_fill(~context, float("-inf")).max(dim=1).values
+    best_end = end_logits.masked_fill(~context, float("-inf")).max(dim=1).values
+    return null_scores - (best_start + best_end) > margin
@@ -0,0 +1,78 @@
+"""Build a lighter CUAD model by dropping encoder layers from the fine-tuned one.
+
+The result is a regular model directory that load_model (any backend) reads,
+used on its own or as the screening model of run_prediction. Dropping layers
+without retraining costs accuracy; fine-tuning the exported directory on
+CUAD (or distilling the full model into it) recovers most of it, and
+benchmarks/bench_all_questions.py measures where a variant stands.
+
+A variant only screens once a margin chosen from that benchmark is recorded
+in its config; run_prediction refuses it otherwise.
+
+    python qa_variants.py --layers 6
+    python qa_variants.py --record-margin 4.0 --output cuad-training/cuad-models-6l/
+"""
+import argparse
+
+import torch
+from transformers import AutoConfig, AutoModelForQuestionAnswering, AutoTokenizer
+
+from predict import MODEL_PATH
+
+LIGHT_MODEL_PATH = "cuad-training/cuad-models-6l/"
+
+
+def spread_layers(n_layers, keep):
+    """keep layer indices spread evenly over n_layers, always including the first and last."""
+    if not 1 <= keep <= n_layers:
+        raise ValueError("cannot keep {} of {} layers".format(keep, n_layers))
+    if keep == 1:
+        return [n_layers - 1]
+    return sorted({round(i * (n_layers - 1) / (keep - 1)) for i in range(keep)})
+
+
+def drop_layers(model, layers):
+    """Keep only the given encoder layers of model, in place."""
+    encoder = getattr(model, model.base_model_prefix).encoder
+    encoder.layer = torch.nn.ModuleList(encoder.layer[index] for index in layers)
+    model.config.num_hidden_layers = len(layers)
+    return model
+
+
+def export_layer_dropped(model_path=MODEL_PATH, output_path=LIGHT_MODEL_PATH, keep=6):
+    model = AutoModelForQuestionAnswering.from_pretrained(model_path)
+    layers = spread_layers(model.config.num_hidden_layers, keep)
+    drop_layers(model, layers)
+    model.config.kept_layers = layers
+    model.save_pretrained(output_path)
+    AutoTokenizer.from_pretrained(model_path, use_fast=False).save_pretrained(output_path)
+    return layers
+
+
+def record_screen_margin(model_path, margin):
+    """Save the screening margin benchmarked for the variant at model_path into its config."""
+    config = AutoConfig.from_pretrained(model_path)
+    config.screen_margin = margin
+    config.save_pretrained(model_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-path", default=MODEL_PATH)
+    parser.add_argument("--output", default=LIGHT_MODEL_PATH)
+    parser.add_argument("--layers", type=int, default=6, help="encoder layers to keep")
+    parser.add_argument("--record-margin", type=float,
+                        help="instead of exporting, record this benchmarked screening margin for --output")
+    args = parser.parse_args()
+
+    if args.record_margin is not None:
+        record_screen_margin(args.output, args.record_margin)
+        print("recorded screening margin {:g} for {}".format(args.record_margin, args.output))
+        return
+
+    layers = export_layer_dropped(args.model_path, args.output, args.layers)
+    print("kept layers {} in {}".format(layers, args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import math
+import re
+from collections import Counter
+
+TOP_K = 5
+PASSAGE_SENTENCES = 3
+
+# CUAD questions read: Highlight the parts (if any) of this contract related to "<category>" that should be
+# reviewed by a lawyer. Details: <description>
+_CUAD_QUESTION = re.compile(r'related to "(?P<category>[^"]+)".*?Details:(?P<details>.*)', re.S)
+
+
+def question_query(question):
+    """The informative part of a question: the CUAD category and its details, or the question as is."""
+    match = _CUAD_QUESTION.search(question)
+    if match is None:
+        return question
+    return match.group("category") + " " + match.group("details")
+
+
+def _terms(tokens):
+    return [token.lemma_.lower() for token in tokens if not (token.is_stop or token.is_punct or token.is_space)]
+
+
+class RelevancePrefilter:
+    """BM25 over lemmatized sentence passages of a parsed contract.
+
+    regions(question) returns the character spans of the top_k passages most
+    relevant to the question; run_prediction then only scores the QA windows
+    overlapping them. doc must be parsed from the same text passed to
+    run_prediction (parse_contract keeps offsets aligned).
+    """
+
+    def __init__(self, nlp, doc, top_k=TOP_K, passage_sentences=PASSAGE_SENTENCES, k1=1.5, b=0.75):
+        self.nlp = nlp
+        self.top_k = top_k
+        self.k1 = k1
+        self.b = b
+
+        sentences = list(doc.sents)
+        self.spans = []
+        self.term_counts = []
+        for start in range(0, len(sentences), passage_sentences):
+            passage = sentences[start:start + passage_sentences]
+            self.spans.append((passage[0].start_char, passage[-1].end_char))
+            self.term_counts.append(Counter(term for sent in passage for term in _terms(sent)))
+
+        self.lengths = [sum(counts.values()) for counts in self.term_counts]
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        document_frequency = Counter(term for counts in self.term_counts for term in counts)
+        n_passages = len(self.term_counts)
+        self.idf = {term: math.log(1 + (n_passages - df + 0.5) / (df + 0.5))
+                    for term, df in document_frequency.items()}
+
+    def scores(self, question):
+        query = set(_terms(self.nlp(question_query(question))))
+        scores = []
+        for counts, length in zip(self.term_counts, self.lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / (self.average_length or 1.0))
+            scores.append(sum(
+                self.idf[term] * counts[term] * (self.k1 + 1) / (counts[term] + norm)
+                for term in query if term in counts))
+        return scores
+
+    def regions(self, question, top_k=None):
+        top_k = self.top_k if top_k is None else top_k
+        scores = self.scores(question)
+        ranked = sorted(range(len(scores)), key=lambda index: scores[index], reverse=True)
+        return sorted(self.spans[index] for index in ranked[:top_k])
@@ -1,43 +1,67 @@
-from transformers import AutoModelForQuestionAnswering, AutoTokenizer
 import streamlit as st
-import json
-from predict import run_prediction
-import fitz
+import os
+from predict import load_model, recorded_screen_margin
 from PIL import Image
-import spacy
-from spacy.matcher import PhraseMatcher
+from analysis import contract_answers, load_questions, pdf_digest, stream_contract
+from doc_store import DocStore
+from flagging import FlaggingEngine
+from inference_service import InferenceClient
+from instrumentation import Tracer, tracing
+from nlp_pipeline import load_nlp
+from result_cache import ResultCache
 
 st.set_page_config(layout="wide")
 
-nlp = spacy.load("en_core_web_sm")
-
-st.cache(show_spinner=True, persist=True)
-
-def load_model():
-    model = AutoModelForQuestionAnswering.from_pretrained("cuad-training/cuad-models/")
-    tokenizer = AutoTokenizer.from_pretrained('cuad-training/cuad-models/', use_fast=False)
-    return model, tokenizer
-
-model, tokenizer = load_model()
-
-
-st.cache(show_spinner=True, persist=True)
-
-
-def load_questions():
-    with open('cuad-training/cuad-data/test.json') as json_file:
-        data = json.load(json_file)
-
-    questions = []
-
-    for i, q in enumerate(data['data'][0]['paragraphs'][0]['qas']):
-        question = data['data'][0]['paragraphs'][0]['qas'][i]['question']
-        questions.append(question)
-
-    listindex = [2, 3, 5, 15]
-    accountingquestions = [questions[index] for index in listindex]
-
-    return accountingquestions
+# lemmas and sentence boundaries only: senter instead of parser, no NER
+nlp = load_nlp("flagging")
+flagger = FlaggingEngine(nlp)
+
+# with QA_SERVICE=host:port every session shares one inference service (see inference_service.py);
+# otherwise the model is resident across script reruns: the registry in predict loads and warms up once per process
+# QA_BACKEND selects pytorch (default), quantized or onnx inference
+if os.environ.get("QA_SERVICE"):
+    model = InferenceClient.from_address(os.environ["QA_SERVICE"])
+else:
+    model = load_model("cuad-training/cuad-models/", backend=os.environ.get("QA_BACKEND", "pytorch"))
+
+# QA_SCREEN_MODEL=path (e.g. a qa_variants layer-dropped model) screens out windows with no answer first,
+# which is what keeps all 41 CUAD questions affordable; it must have a benchmarked margin recorded
+screen = None
+if os.environ.get("QA_SCREEN_MODEL") and not os.environ.get("QA_SERVICE"):
+    screen = load_model(os.environ["QA_SCREEN_MODEL"], backend=os.environ.get("QA_BACKEND", "pytorch"))
+    # refuse an unmeasured screening model at startup rather than on the first contract
+    recorded_screen_margin(screen)
+
+# text, flags and answers keyed by PDF content hash, shared by every session and process
+cache = ResultCache()
+# parsed contracts, so a lexicon change only re-runs the matcher over contracts seen before
+store = DocStore()
+
+# METRICS_LOG=path appends every analysis' timing spans there as JSON lines
+METRICS_LOG = os.environ.get("METRICS_LOG")
+
+
+def track_progress(bar, start, end, screened=False):
+    """Span listener moving bar from start to end as QA inference batches finish.
+
+    With screened, every window is first scored by the screening model, so
+    until screening ends the total counts each window twice.
+    """
+    windows = {"total": 0, "done": 0, "shown": start}
+
+    def listener(span):
+        if span.name in ("features", "prefilter"):
+            windows["total"] = span.counts["features"] * (2 if screened else 1)
+        elif span.name == "screen":
+            # screening batches are done; only the windows it kept are scored again by the full model
+            screened_windows = span.counts["features"] + span.counts["skipped_features"]
+            windows["total"] = screened_windows + span.counts["features"]
+        elif span.name == "inference_batch" and windows["total"]:
+            windows["done"] += span.counts["features"]
+            windows["shown"] = max(windows["shown"], start + (end - start) * windows["done"] // windows["total"])
+            bar.progress(windows["shown"])
+
+    return listener
 
 
 st.title("Project Rainier Demo")
@@ -54,6 +78,7 @@ st.subheader(
 add_text_sidebar = st.sidebar.title("Project Rainier")
 add_text_sidebar = st.sidebar.text(
     "The Project Rainier has two functions:\n\n1. Machine learning model highlights \nterms that are relevant for \nASC 606 determination.\n\n2. AI powered general understanding \nextraction highlighting important terms \nfor pre-defined legal questions.\n \nThe current AI and machine learning \nmodels are tailored specifically \nfor Itron,Inc.")
+all_questions = st.sidebar.checkbox("Ask all 41 CUAD questions", value=False)
 add_text_sidebar = st.sidebar.text(
     "In honor of all the broken hearts \nresulted from reviewing lengthy \nand miserable contracts LOL")
 
@@ -62,265 +87,46 @@ if __name__ == '__main__':
     # Add a progress bar
     st.write('Progress Tracking')
     bar = st.progress(0)
-    st.cache(show_spinner=True, persist=True)
 
     # add an uploader and analyze the file
     uploaded_file = st.file_uploader("Upload OCR readable pdf files only", type=['pdf'])
 
     if uploaded_file is not None:
-        with st.spinner('Starting AI and Machine Learning computation...Be patient human...'):
-            with fitz.open(stream=uploaded_file.read(), filetype="pdf") as doc:
-                contract = ""
-                for page in doc:
-                    contract += page.getText()
-                doc.close()
+        tracer = Tracer(track_progress(bar, 50, 99, screened=screen is not None))
+        with st.spinner('Starting AI and Machine Learning computation...Be patient human...'), tracing(tracer):
+            pdf_bytes = uploaded_file.read()
+            digest = pdf_digest(pdf_bytes)
 
-            bar.progress(5)
-            st.cache(show_spinner=True, persist=True)
-
-            # show the file content uploaded
+            # show the file content uploaded (filled in once every page has been read)
             my_expander = st.beta_expander("Contract Imported", expanded=False)
-            my_expander.write(contract)
-
-            # spacy program initiated
-            # use all CPUs
-            doc = nlp.pipe(contract, n_process=-1)
-            doc = nlp(contract)
-            bar.progress(10)
-            st.cache(show_spinner=True, persist=True)
 
             # spacy search
-            # copy below lines for each key term search
+            # add new key terms to asc606_lexicon.json
             st.subheader("Machine Learning powered ASC 606 flagging (returns BLANK if no ASC606 relevant term is found):")
             st.write("\n")
+            pages = []
+            complete = False
             try:
-                # ML VC Search
-                VariableConsideration_matcher = PhraseMatcher(nlp.vocab, attr="LEMMA")
-                VC_phrases = ['tier price', 'price adjustment', 'liquidated damage', 'penalty', 'credit', 'discount',
-                              'refund', 'bonus',
-                              'not to exceed', 'price guarantee', 'price protection', 'cash', 'no cost',
-                              'no additional charge']
-                VC_patterns = [nlp(text) for text in VC_phrases]
-                # add an ID key for the phrase_matcher
-                VariableConsideration_matcher.add('VC', None, *VC_patterns)
-                # replace the following for new key term search
-                for sent in doc.sents:
-                    for match_id, start, end in VariableConsideration_matcher(nlp(sent.text)):
-                        st.write("VC flag:")
-                        if nlp.vocab.strings[match_id] in ["VC"]:
-                            st.write(sent.text)
-                            st.write(
-                                "------------------------------------------------------------------------------------")
-                bar.progress(15)
-                st.cache(show_spinner=True, persist=True)
-                # copy below lines for each key term search
-                Performance_Acceptance_matcher = PhraseMatcher(nlp.vocab, attr="LEMMA")
-                Performance_Acceptance_phrases = ['acceptance criteria', 'service level', 'performance guarantee',
-                                                  'fan guarantee'
-                                                  'coverage ratio']
-                Performance_Acceptance_patterns = [nlp(text) for text in Performance_Acceptance_phrases]
-                # add an ID key for the phrase_matcher
-                Performance_Acceptance_matcher.add('Performance_Acceptance', None, *Performance_Acceptance_patterns)
-                # replace the following for new key term search
-                for sent in doc.sents:
-                    for match_id, start, end in Performance_Acceptance_matcher(nlp(sent.text)):
-                        st.write("Performance or Acceptance flag:")
-                        if nlp.vocab.strings[match_id] in ["Performance_Acceptance"]:
-                            st.write(sent.text)
+                # pages are extracted, parsed and flagged one at a time so reviewers can start right away;
+                # a contract seen before comes straight from the cache. This trades the multi-process
+                # parse of contract_flags(n_process=-1) for first flags within a page's parse time
+                for page in stream_contract(pdf_bytes, digest, nlp, flagger, cache, store):
+                    pages.append(page.text)
+                    for category, category_flags in page.flags.items():
+                        for flag in category_flags:
+                            st.write(flagger.labels[category])
+                            st.write(flag.sentence)
                             st.write(
                                 "------------------------------------------------------------------------------------")
-                bar.progress(20)
-                st.cache(show_spinner=True, persist=True)
-                # copy below lines for each key term search
-                Enforceability_matcher = PhraseMatcher(nlp.vocab, attr="LEMMA")
-                Enforceability_phrases = ['binding forecast', 'cancel', 'early termination',
-                                          'termination for convenience',
-                                          'nonrefundable', 'non-refundable']
-                Enforceability_patterns = [nlp(text) for text in Enforceability_phrases]
-                # add an ID key for the phrase_matcher
-                Enforceability_matcher.add('Enforceability', None, *Enforceability_patterns)
-                # replace the following for new key term search
-                for sent in doc.sents:
-                    for match_id, start, end in Enforceability_matcher(nlp(sent.text)):
-                        st.write("Enforceability flag:")
-                        if nlp.vocab.strings[match_id] in ["Enforceability"]:
-                            st.write(sent.text)
-                            st.write(
-                                "------------------------------------------------------------------------------------")
-                bar.progress(25)
-                st.cache(show_spinner=True, persist=True)
-                # copy below lines for each key term search
-                Transfer_matcher = PhraseMatcher(nlp.vocab, attr="LEMMA")
-                Transfer_phrases = ['FOB destination', 'FOB shipping point', 'title', 'ownership', 'risk of loss'
-                                                                                                   'FOB origin',
-                                    'shipment term',
-                                    'shipping term', 'bill and hold']
-                Transfer_patterns = [nlp(text) for text in Transfer_phrases]
-                # add an ID key for the phrase_matcher
-                Transfer_matcher.add('Transfer', None, *Transfer_patterns)
-                # replace the following for new key term search
-                for sent in doc.sents:
-                    for match_id, start, end in Transfer_matcher(nlp(sent.text)):
-                        st.write("Transfer flag:")
-                        if nlp.vocab.strings[match_id] in ["Transfer"]:
-                            st.write(sent.text)
-                            st.write(
-                                "------------------------------------------------------------------------------------")
-                bar.progress(30)
-                st.cache(show_spinner=True, persist=True)
-                # copy below lines for each key term search
-                MR_matcher = PhraseMatcher(nlp.vocab, attr="LEMMA")
-                MR_phrases = ['option', 'right to purchase', 'to be determined', 'TBD', 'upgrade', 'firmware update',
-                              '5G update',
-                              'regulatory approval', 'state approval', 'government approval', 'agency approval',
-                              'council approval']
-                MR_patterns = [nlp(text) for text in MR_phrases]
-                # add an ID key for the phrase_matcher
-                MR_matcher.add('MR', None, *MR_patterns)
-                # replace the following for new key term search
-                for sent in doc.sents:
-                    for match_id, start, end in MR_matcher(nlp(sent.text)):
-                        st.write("Option, material right and other rights flag:")
-                        if nlp.vocab.strings[match_id] in ["MR"]:
-                            st.write(sent.text)
-                            st.write(
-                                "------------------------------------------------------------------------------------")
-                bar.progress(35)
-                st.cache(show_spinner=True, persist=True)
-                # copy below lines for each key term search
-                Warranty_matcher = PhraseMatcher(nlp.vocab, attr="LEMMA")
-                Warranty_phrases = ['warranty period', 'extended warranty', 'standard warranty', 'third party warranty']
-                Warranty_patterns = [nlp(text) for text in Warranty_phrases]
-                # add an ID key for the phrase_matcher
-                Warranty_matcher.add('Warranty', None, *Warranty_patterns)
-                # replace the following for new key term search
-                for sent in doc.sents:
-                    for match_id, start, end in Warranty_matcher(nlp(sent.text)):
-                        st.write("Warranty flag:")
-                        if nlp.vocab.strings[match_id] in ["Warranty"]:
-                            st.write(sent.text)
-                            st.write(
-                                "------------------------------------------------------------------------------------")
-                bar.progress(40)
-                st.cache(show_spinner=True, persist=True)
-                # copy below lines for each key term search
-                Pmt_Term_matcher = PhraseMatcher(nlp.vocab, attr="LEMMA")
-                Pmt_Term_phrases = ['payment', 'invoice']
-                Pmt_Term_patterns = [nlp(text) for text in Pmt_Term_phrases]
-                # add an ID key for the phrase_matcher
-                Pmt_Term_matcher.add('Payment', None, *Pmt_Term_patterns)
-                # replace the following for new key term search
-                for sent in doc.sents:
-                    for match_id, start, end in Pmt_Term_matcher(nlp(sent.text)):
-                        st.write("Payment Term flag:")
-                        if nlp.vocab.strings[match_id] in ["Payment"]:
-                            st.write(sent.text)
-                            st.write(
-                                "------------------------------------------------------------------------------------")
-                bar.progress(45)
-                st.cache(show_spinner=True, persist=True)
-                # copy below lines for each key term search
-                Right_of_Return_matcher = PhraseMatcher(nlp.vocab, attr="LEMMA")
-                Right_of_Return_phrases = ['refund', 'return', 'rework', 're-work', 'exchange', 'Repurchase']
-                Right_of_Return_patterns = [nlp(text) for text in Right_of_Return_phrases]
-                # add an ID key for the phrase_matcher
-                Right_of_Return_matcher.add('Right_of_Return', None, *Right_of_Return_patterns)
-                # replace the following for new key term search
-                for sent in doc.sents:
-                    for match_id, start, end in Right_of_Return_matcher(nlp(sent.text)):
-                        st.write("Right of Return, Rework or Repurchase flag:")
-                        if nlp.vocab.strings[match_id] in ["Right_of_Return"]:
-                            st.write(sent.text)
-                            st.write(
-                                "------------------------------------------------------------------------------------")
-                bar.progress(50)
-                st.cache(show_spinner=True, persist=True)
-                License_Patent_matcher = PhraseMatcher(nlp.vocab, attr="LEMMA")
-                License_Patent_phrases = ['right to use', 'license', 'patent', 'right to access']
-                License_Patent_patterns = [nlp(text) for text in License_Patent_phrases]
-                # add an ID key for the phrase_matcher
-                License_Patent_matcher.add('License_Patent', None, *License_Patent_patterns)
-                # replace the following for new key term search
-                for sent in doc.sents:
-                    for match_id, start, end in License_Patent_matcher(nlp(sent.text)):
-                        st.write("License, patent or access flag:")
-                        if nlp.vocab.strings[match_id] in ["License_Patent"]:
-                            st.write(sent.text)
-                            st.write(
-                                "------------------------------------------------------------------------------------")
-                bar.progress(55)
-                st.cache(show_spinner=True, persist=True)
-                Principal_Agent_matcher = PhraseMatcher(nlp.vocab, attr="LEMMA")
-                Principal_Agent_phrases = ['agent', 'principal', 'third party', 'subcontractor', 'supplier', 'vendor',
-                                           'RACI']
-                Principal_Agent_patterns = [nlp(text) for text in Principal_Agent_phrases]
-                # add an ID key for the phrase_matcher
-                Principal_Agent_matcher.add('Principal_Agent', None, *Principal_Agent_patterns)
-                # replace the following for new key term search
-                for sent in doc.sents:
-                    for match_id, start, end in Principal_Agent_matcher(nlp(sent.text)):
-                        st.write("Principal vs Agent flag:")
-                        if nlp.vocab.strings[match_id] in ["Principal_Agent"]:
-                            st.write(sent.text)
-                            st.write(
-                                "------------------------------------------------------------------------------------")
-                bar.progress(60)
-                st.cache(show_spinner=True, persist=True)
-                Related_Agreement_matcher = PhraseMatcher(nlp.vocab, attr="LEMMA")
-                Related_Agreement_phrases = ['side agreement', 'vendor agreement', 'vendor SOW',
-                                             'installation agreement',
-                                             'installation SOW', 'subcontractor agreement', 'subcontractor SOW',
-                                             'loan document',
-                                             'lease document', 'financing document', 'loan agreement',
-                                             'lease agreement',
-                                             'financing agreement', 'csa', 'customer specific addendum', 'addendum']
-                Related_Agreement_patterns = [nlp(text) for text in Related_Agreement_phrases]
-                # add an ID key for the phrase_matcher
-                Related_Agreement_matcher.add('Related_Agreement', None, *Related_Agreement_patterns)
-                # replace the following for new key term search
-                for sent in doc.sents:
-                    for match_id, start, end in Related_Agreement_matcher(nlp(sent.text)):
-                        st.write("Related Agreements flag:")
-                        if nlp.vocab.strings[match_id] in ["Related_Agreement"]:
-                            st.write(sent.text)
-                            st.write(
-                                "------------------------------------------------------------------------------------")
-                bar.progress(65)
-                st.cache(show_spinner=True, persist=True)
-                # copy below lines for each key term search
-                Retention_Bond_matcher = PhraseMatcher(nlp.vocab, attr="LEMMA")
-                Retention_Bond_phrases = ['retention amount', 'bond', 'withhold']
-                Retention_Bond_patterns = [nlp(text) for text in Retention_Bond_phrases]
-                # add an ID key for the phrase_matcher
-                Retention_Bond_matcher.add('Retention_Bond', None, *Retention_Bond_patterns)
-                # replace the following for new key term search
-                for sent in doc.sents:
-                    for match_id, start, end in Retention_Bond_matcher(nlp(sent.text)):
-                        st.write("Retention or Bond flag:")
-                        if nlp.vocab.strings[match_id] in ["Retention_Bond"]:
-                            st.write(sent.text)
-                            st.write(
-                                "------------------------------------------------------------------------------------")
-                bar.progress(70)
-                st.cache(show_spinner=True, persist=True)
-                # ML search other matters
-                Other_Matters_matcher = PhraseMatcher(nlp.vocab, attr="LEMMA")
-                Other_Matters_phrases = ['tax', 'reimburse', 'indemnify', 'term of']
-                Other_Matters_patterns = [nlp(text) for text in Other_Matters_phrases]
-                # add an ID key for the phrase_matcher
-                Other_Matters_matcher.add('Other_Matters', None, *Other_Matters_patterns)
-                # replace the following for new key term search
-                for sent in doc.sents:
-                    for match_id, start, end in Other_Matters_matcher(nlp(sent.text)):
-                        st.write("Other_Matters (e.g., expense, taxes, indemnification,contract terms, etc.) flag:")
-                        if nlp.vocab.strings[match_id] in ["Other_Matters"]:
-                            st.write(sent.text)
-                            st.write(
-                                "------------------------------------------------------------------------------------")
-                bar.progress(75)
-                st.cache(show_spinner=True, persist=True)
-            except:
-                st.write("Machine Learning model has not flagged any ASC606 relevant terms. Check contract imported.")
+                    bar.progress(50 * (page.page_number + 1) // page.page_count)
+                complete = True
+            except Exception as error:
+                st.write("Machine Learning flagging stopped early ({}: {}). Check contract imported.".format(
+                    type(error).__name__, error))
+
+            contract = "".join(pages)
+            my_expander.write(contract)
+            bar.progress(50)
 
             # AI STARTS HERE!!!!!!!!!!!!!!!!!!!upload models and ASC 606 questions
 
@@ -328,23 +134,18 @@ if __name__ == '__main__':
             st.subheader("AI powered overall contract review section (returns BLANK if no relevant question is found):")
             st.write("Warning: AI may not be accurate so please exercise your due diligence and care.")
             st.write("\n")
-            bar.progress(80)
-            st.cache(show_spinner=True, persist=True)
 
-            questions = load_questions()
-            bar.progress(85)
-            st.cache(show_spinner=True, persist=True)
+            questions = load_questions(indices=None) if all_questions else load_questions()
 
-            # run predictions
+            # run predictions; the progress bar follows the inference batches
             try:
+                if not complete:
+                    # answers over part of the contract would be misleading
+                    raise RuntimeError("the contract was not read to the end, so it was not reviewed")
                 index = 1
-                prediction = run_prediction(questions[:], contract, model)
-                bar.progress(95)
-                st.cache(show_spinner=True, persist=True)
+                prediction = contract_answers(contract, digest, questions, model, cache, screen)
 
                 answers = list(prediction.values())
-                bar.progress(99)
-                st.cache(show_spinner=True, persist=True)
 
                 # only write out questions and answers if an answer is found
 
@@ -355,12 +156,19 @@ if __name__ == '__main__':
                         index += 1
                     else:
                         index += 1
-            except:
+            except Exception as error:
                 st.write(
-                    "Nothing is found by the AI. Check 'Contract Imported' to see whether contract has been correctly imported or not.")
+                    "The AI review failed ({}: {}). Check 'Contract Imported' to see whether contract has been correctly imported or not.".format(
+                        type(error).__name__, error))
             bar.progress(100)
+
+            # where this contract's time went, per stage
+            timings = st.beta_expander("Timings", expanded=False)
+            timings.json(tracer.totals())
+            if METRICS_LOG:
+                with open(METRICS_LOG, "a") as metrics_log:
+                    metrics_log.write(tracer.json_lines())
             st.subheader("Congrats we finished the analysis together!")
-            st.cache(show_spinner=True, persist=True)
             st.balloons()
             contract = ""
     else: